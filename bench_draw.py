@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Benchmark of draw strategies on synthetic groups.
+
+Times every strategy of draw.py over group sizes and exclusion densities and
+prints p50/p99 latency, peak memory and failure rate as JSON:
+
+    python bench_draw.py --output bench_output.json
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Set
+
+import draw
+from draw import DrawError, build_forbidden, build_penalties
+
+DEFAULT_SIZES = [10, 100, 1000, 10000, 100000]
+DEFAULT_DENSITIES = [0.0, 0.01, 0.1, 0.5]
+
+# Strategies that build the full O(n^2) candidate graph are skipped above this
+MAX_GRAPH_EDGES = 4_000_000
+# Synthetic exclusion sets larger than this are not generated at all
+MAX_EXCLUSIONS = 2_000_000
+
+
+def make_group(size: int, density: float, rng: random.Random) -> Dict[int, Set[int]]:
+    """Members 1..size with `density` of all santa -> receiver pairs forbidden"""
+    members = list(range(1, size + 1))
+    wanted = int(density * size * (size - 1))
+    pairs = set()
+    while len(pairs) < wanted:
+        santa_id, receiver_id = rng.randint(1, size), rng.randint(1, size)
+        if santa_id != receiver_id:
+            pairs.add((santa_id, receiver_id))
+    return build_forbidden(members, [(s, r, 'directional') for s, r in pairs])
+
+
+def make_history(members: List[int], rng: random.Random, years: int = draw.HISTORY_DEPTH):
+    """Pairs of `years` previous random draws"""
+    history = []
+    for age in range(years):
+        cycle = members[:]
+        rng.shuffle(cycle)
+        history += [(santa_id, cycle[(i + 1) % len(cycle)], age) for i, santa_id in enumerate(cycle)]
+    return history
+
+
+def percentile(values: List[float], share: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(share * len(ordered))) - 1))]
+
+
+def strategies(members: List[int], forbidden: Dict[int, Set[int]],
+               rng: random.Random) -> Dict[str, Callable[[random.Random], object]]:
+    """Strategy name -> call drawing the group once"""
+    penalties = build_penalties(members, make_history(members, rng))
+    return {
+        'matching': lambda r: draw.match_assignment(members, forbidden, r),
+        'cycle': lambda r: draw.cycle_assignment(members, forbidden, r),
+        'random_cycle': lambda r: draw.random_cycle_assignment(members, forbidden, r),
+        'large_cycle': lambda r: draw.large_cycle_assignment(members, forbidden, r),
+        'min_cost': lambda r: draw.min_cost_assignment(members, forbidden, penalties, r),
+    }
+
+
+def skip_reason(name: str, size: int, forbidden: Dict[int, Set[int]]) -> Optional[str]:
+    """Why a strategy is not run for this group, None if it is"""
+    full_graph = name in ('matching', 'min_cost') or (name == 'cycle' and any(forbidden.values()))
+    if full_graph and size * size > MAX_GRAPH_EDGES:
+        return f"O(n^2) graph over {MAX_GRAPH_EDGES} edges"
+    return None
+
+
+def measure(call: Callable[[random.Random], object], runs: int, seed: int) -> dict:
+    """Latency percentiles, peak memory and failure rate of one strategy"""
+    timings = []
+    failures = 0
+    for run in range(runs):
+        rng = random.Random(seed + run)
+        started = time.perf_counter()
+        try:
+            call(rng)
+        except DrawError:
+            failures += 1
+        timings.append((time.perf_counter() - started) * 1000)
+
+    # Separate run: tracing allocations slows the timed ones down
+    tracemalloc.start()
+    try:
+        call(random.Random(seed))
+    except DrawError:
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'runs': runs,
+        'p50_ms': round(percentile(timings, 0.50), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'peak_kib': round(peak / 1024, 1),
+        'failure_rate': failures / runs,
+    }
+
+
+def run_benchmark(sizes: List[int], densities: List[float], runs: int, seed: int) -> dict:
+    """Benchmark every strategy over the size x density grid"""
+    results = []
+    for size in sizes:
+        for density in densities:
+            case = {'members': size, 'density': density}
+            if density * size * (size - 1) > MAX_EXCLUSIONS:
+                for name in ('matching', 'cycle', 'random_cycle', 'large_cycle', 'min_cost'):
+                    results.append({'strategy': name, **case, 'skipped': f"over {MAX_EXCLUSIONS} exclusions"})
+                continue
+
+            rng = random.Random(seed)
+            forbidden = make_group(size, density, rng)
+            members = sorted(forbidden)
+            for name, call in strategies(members, forbidden, rng).items():
+                reason = skip_reason(name, size, forbidden)
+                if reason:
+                    results.append({'strategy': name, **case, 'skipped': reason})
+                    continue
+                print(f"{name}: {size} members, density {density}", file=sys.stderr)
+                results.append({'strategy': name, **case, **measure(call, runs, seed)})
+
+    return {
+        'python': platform.python_version(),
+        'seed': seed,
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark draw strategies")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--densities', type=float, nargs='+', default=DEFAULT_DENSITIES)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=2024)
+    parser.add_argument('--output', help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.sizes, args.densities, args.runs, args.seed)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,66 @@
 import asyncio
+import contextlib
 import logging
-import random
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional, List
+from typing import Dict, Optional, List, Tuple
 
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import BaseStorage
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, delete, func, and_, or_
+from sqlalchemy import select, update, and_, true
+from sqlalchemy.orm import aliased, joinedload
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 import pytz
 
-from config import BOT_TOKEN, ADMIN_ID, TIMEZONE
-from database import get_db_session, User, Event, DrawResult, Group, user_group_association
-from database import generate_invite_code, InviteCode, ExclusionRule
+from config import BOT_TOKEN, ADMIN_ID, TIMEZONE, DRAW_WORKERS, DRAW_CHECK_INTERVAL, INVITE_BLOOM_REFRESH
+from config import FSM_STORAGE, FSM_FLUSH_INTERVAL, FSM_CACHE_SIZE, FSM_RECORD_TTL, REDIS_URL
+from database import async_engine, replica_engine, AsyncSessionLocal, is_replica_session
+from database import get_db_session, get_pool_stats
+from database import User, Event, DrawResult, Group, user_group_association
+from database import add_group, add_group_member, remove_group_member, InviteCode
+from database import redeem_invite, REDEEM_JOINED, REDEEM_NOT_FOUND, REDEEM_CLOSED, REDEEM_ALREADY_MEMBER
+from database import REDEEM_INVITE_EXPIRED, REDEEM_FULL
+from draw import DrawError, NotEnoughParticipantsError, DrawInfeasibleError, MIN_DRAW_PARTICIPANTS
+from draw import DRAW_METHOD_AUTO, DRAW_METHOD_CYCLE
+from draw_service import run_draw, run_due_draws, replay_draw, DrawAlreadyExistsError
+from draw_service import add_member_to_draw, remove_member_from_draw, add_exclusion_rule
+from draw_service import get_group_member_ids, get_exclusion_rules
+from cache import UserSnapshot, user_cache, membership_cache, invite_cache
+from fsm_storage import PostgresStorage
+import templates
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+def create_fsm_storage() -> BaseStorage:
+    """FSM storage chosen by FSM_STORAGE"""
+    if FSM_STORAGE == 'postgres':
+        return PostgresStorage(async_engine, flush_interval=FSM_FLUSH_INTERVAL, cache_size=FSM_CACHE_SIZE,
+                               record_ttl=FSM_RECORD_TTL)
+    if FSM_STORAGE == 'redis':
+        from aiogram.fsm.storage.redis import RedisStorage
+        return RedisStorage.from_url(REDIS_URL)
+    if FSM_STORAGE == 'memory':
+        return MemoryStorage()
+    raise ValueError(f"Unknown FSM_STORAGE: {FSM_STORAGE}")
+
+
 # Initialize bot
 bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
+storage = create_fsm_storage()
 dp = Dispatcher(storage=storage)
 scheduler = AsyncIOScheduler(timezone=TIMEZONE)
+draw_executor = ProcessPoolExecutor(max_workers=DRAW_WORKERS)
 
 
 # ==================== STATES ====================
@@ -59,36 +91,39 @@ class UserStates(StatesGroup):
 
 # ==================== HELPER FUNCTIONS ====================
 
-async def get_user(session: AsyncSession, telegram_id: int) -> Optional[User]:
-    """Get user by telegram ID"""
+async def get_user(session: AsyncSession, telegram_id: int) -> Optional[UserSnapshot]:
+    """Get user by telegram ID, served from user_cache when possible"""
+    snapshot = user_cache.get(telegram_id)
+    if snapshot is not None:
+        return snapshot
+
     result = await session.execute(
         select(User).where(User.telegram_id == telegram_id)
     )
-    return result.scalar_one_or_none()
+    user = result.scalar_one_or_none()
+    if user is None:
+        return None
 
+    snapshot = UserSnapshot.from_user(user)
+    user_cache.put(telegram_id, snapshot)
+    return snapshot
 
-async def get_group(session: AsyncSession, group_id: int) -> Optional[Group]:
-    """Get group by ID"""
+
+async def get_group(session: AsyncSession, group_id: int, *options) -> Optional[Group]:
+    """Get group by ID, loader options name the relationships to load with it"""
     result = await session.execute(
-        select(Group).where(Group.id == group_id)
+        select(Group).where(Group.id == group_id).options(*options)
     )
     return result.scalar_one_or_none()
 
 
 async def get_active_event(session: AsyncSession, group_id: Optional[int] = None) -> Optional[Event]:
-    """Get active event for group"""
+    """Get latest waiting or active event for group"""
+    query = select(Event).where(Event.status.in_(['waiting', 'active']))
     if group_id:
-        result = await session.execute(
-            select(Event).where(
-                Event.group_id == group_id,
-                Event.status.in_(['waiting', 'active'])
-            ).order_by(Event.created_at.desc())
-        )
-    else:
-        result = await session.execute(
-            select(Event).where(Event.status.in_(['waiting', 'active']))
-        )
-    return result.scalar_one_or_none()
+        query = query.where(Event.group_id == group_id)
+    result = await session.execute(query.order_by(Event.created_at.desc()).limit(1))
+    return result.scalars().first()
 
 
 def is_admin(user_id: int) -> bool:
@@ -97,26 +132,56 @@ def is_admin(user_id: int) -> bool:
 
 
 async def user_in_group(session: AsyncSession, user_id: int, group_id: int) -> bool:
-    """Check if user is in group"""
-    result = await session.execute(
-        select(user_group_association).where(
-            user_group_association.c.user_id == user_id,
-            user_group_association.c.group_id == group_id
-        )
-    )
-    return result.first() is not None
+    """Check if user is in group, loading user's memberships into membership_cache once.
+
+    The cache is filled from the primary only: a lagging replica may not have
+    a join this process already applied, and would pin the stale set until the TTL.
+    """
+    group_ids = membership_cache.get(user_id)
+    if group_ids is None:
+        version = membership_cache.version(user_id)
+        source = AsyncSessionLocal() if is_replica_session(session) else contextlib.nullcontext(session)
+        async with source as primary:
+            result = await primary.execute(
+                select(user_group_association.c.group_id).where(user_group_association.c.user_id == user_id)
+            )
+            group_ids = membership_cache.put(user_id, result.scalars().all(), version)
+    return group_id in group_ids
 
 
-async def get_user_groups(session: AsyncSession, user_id: int) -> List[Group]:
+async def get_user_groups(session: AsyncSession, user_id: int, *options) -> List[Group]:
     """Get all groups where user is a member"""
     result = await session.execute(
         select(Group).join(
             user_group_association, Group.id == user_group_association.c.group_id
-        ).where(user_group_association.c.user_id == user_id)
+        ).where(user_group_association.c.user_id == user_id).options(*options)
     )
     return result.scalars().all()
 
 
+async def get_user_groups_overview(session: AsyncSession, user_id: int,
+                                   *options) -> List[Tuple[Group, int, Optional[str]]]:
+    """Get user's groups with member count and latest active event status in one query"""
+    active_event = (
+        select(Event.status)
+        .where(Event.group_id == Group.id, Event.status.in_(['waiting', 'active']))
+        .order_by(Event.created_at.desc())
+        .limit(1)
+        .lateral('active_event')
+    )
+    result = await session.execute(
+        select(Group, Group.member_count, active_event.c.status)
+        .join(user_group_association, and_(
+            user_group_association.c.group_id == Group.id,
+            user_group_association.c.user_id == user_id
+        ))
+        .outerjoin(active_event, true())
+        .order_by(Group.id)
+        .options(*options)
+    )
+    return result.all()
+
+
 # ==================== USER COMMANDS ====================
 
 @dp.message(Command("start"))
@@ -127,20 +192,14 @@ async def cmd_start(message: types.Message, state: FSMContext):
 
         if user:
             # User already registered - show main menu
-            keyboard = InlineKeyboardBuilder()
-            keyboard.button(text="📋 Мой профиль", callback_data="profile")
-            keyboard.button(text="👥 Мои группы", callback_data="my_groups")
-            keyboard.button(text="🎮 Активная игра", callback_data="active_game")
-
             if is_admin(message.from_user.id):
-                keyboard.button(text="👑 Админ-панель", callback_data="admin_panel")
-
-            keyboard.adjust(2)
+                keyboard = templates.ADMIN_MAIN_MENU_KEYBOARD
+            else:
+                keyboard = templates.MAIN_MENU_KEYBOARD
 
             await message.answer(
-                f"🎅 Добро пожаловать, {user.full_name}!\n\n"
-                f"Выберите действие:",
-                reply_markup=keyboard.as_markup()
+                templates.WELCOME_BACK.render(full_name=user.full_name),
+                reply_markup=keyboard.render()
             )
         else:
             # New user - start registration
@@ -188,6 +247,7 @@ async def process_wishlist(message: types.Message, state: FSMContext):
 
         session.add(new_user)
         await session.commit()
+        user_cache.invalidate(message.from_user.id)
 
         await message.answer(
             f"✅ Регистрация успешно завершена!\n\n"
@@ -208,7 +268,7 @@ async def process_wishlist(message: types.Message, state: FSMContext):
 @dp.message(Command("profile"))
 async def cmd_profile(message: types.Message):
     """Show user profile with edit options"""
-    async with get_db_session() as session:
+    async with get_db_session(read_only=True) as session:
         user = await get_user(session, message.from_user.id)
 
         if not user:
@@ -218,22 +278,20 @@ async def cmd_profile(message: types.Message):
         # Get user's groups
         groups = await get_user_groups(session, user.id)
 
-        response = f"👤 **Ваш профиль**\n\n"
-        response += f"• Имя: {user.full_name}\n"
-        response += f"• Пожелания: {user.wishlist[:100]}...\n"
-        response += f"• Групп: {len(groups)}\n"
-        response += f"• Дата регистрации: {user.registered_at.strftime('%d.%m.%Y')}\n"
-
+        response = templates.PROFILE.render(
+            full_name=user.full_name,
+            wishlist=user.wishlist[:100],
+            group_count=len(groups),
+            registered_at=user.registered_at
+        )
         if is_admin(message.from_user.id):
-            response += f"• 👑 Статус: Администратор\n"
-
-        keyboard = InlineKeyboardBuilder()
-        keyboard.button(text="✏️ Изменить ФИО", callback_data="edit_name")
-        keyboard.button(text="🎁 Изменить пожелания", callback_data="edit_wishlist")
-        keyboard.button(text="📱 Добавить контакты", callback_data="add_contacts")
-        keyboard.adjust(2)
+            response += templates.PROFILE_ADMIN
 
-        await message.answer(response, reply_markup=keyboard.as_markup(), parse_mode="Markdown")
+        await message.answer(
+            response,
+            reply_markup=templates.PROFILE_KEYBOARD.render(),
+            parse_mode=templates.PARSE_MODE
+        )
 
 
 # ==================== GROUP MANAGEMENT ====================
@@ -288,19 +346,12 @@ async def process_group_description(message: types.Message, state: FSMContext):
         new_group = Group(
             name=user_data['group_name'],
             description=description,
-            invite_code=generate_invite_code(),
             creator_id=user.id
         )
-        session.add(new_group)
-        await session.commit()
-        await session.refresh(new_group)
+        await add_group(session, new_group)
 
         # Add creator to group
-        stmt = user_group_association.insert().values(
-            user_id=user.id,
-            group_id=new_group.id
-        )
-        await session.execute(stmt)
+        await add_group_member(session, new_group.id, user.id)
 
         # Create default event for the group
         default_event = Event(
@@ -310,6 +361,8 @@ async def process_group_description(message: types.Message, state: FSMContext):
         )
         session.add(default_event)
         await session.commit()
+        membership_cache.joined(user.id, new_group.id)
+        invite_cache.added(new_group.invite_code)
 
         # Create invite code
         invite = InviteCode(
@@ -323,16 +376,8 @@ async def process_group_description(message: types.Message, state: FSMContext):
         await session.commit()
 
         await message.answer(
-            f"✅ Группа *{new_group.name}* создана!\n\n"
-            f"📋 **Информация:**\n"
-            f"• Код приглашения: `{new_group.invite_code}`\n"
-            f"• Участников: 1\n"
-            f"• Статус: Открыта для регистрации\n\n"
-            f"📢 **Пригласите друзей:**\n"
-            f"Отправьте им код: `{new_group.invite_code}`\n"
-            f"Или используйте команду:\n"
-            f"`/join {new_group.invite_code}`",
-            parse_mode="Markdown"
+            templates.GROUP_CREATED.render(name=new_group.name, invite_code=new_group.invite_code),
+            parse_mode=templates.PARSE_MODE
         )
 
     await state.clear()
@@ -350,84 +395,67 @@ async def join_group_init(callback: types.CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
+REDEEM_ERRORS = {
+    REDEEM_NOT_FOUND: "❌ Группа с таким кодом не найдена",
+    REDEEM_CLOSED: "❌ Регистрация в этой группе закрыта",
+    REDEEM_ALREADY_MEMBER: "❌ Вы уже состоите в этой группе",
+    REDEEM_INVITE_EXPIRED: "❌ Код приглашения истек или больше недействителен",
+    REDEEM_FULL: "❌ Группа заполнена",
+}
+
+
 @dp.message(GroupStates.joining_group)
 async def process_join_group(message: types.Message, state: FSMContext):
     """Process group joining"""
     invite_code = message.text.upper().strip()
 
     async with get_db_session() as session:
-        # Find group by invite code
-        result = await session.execute(
-            select(Group).where(Group.invite_code == invite_code)
-        )
-        group = result.scalar_one_or_none()
-
-        if not group:
-            await message.answer("❌ Группа с таким кодом не найдена")
-            await state.clear()
-            return
-
-        if not group.registration_open:
-            await message.answer("❌ Регистрация в этой группе закрыта")
-            await state.clear()
-            return
-
-        # Check if user is already in group
         user = await get_user(session, message.from_user.id)
         if not user:
             await message.answer("❌ Сначала зарегистрируйтесь через /start")
             await state.clear()
             return
 
-        if await user_in_group(session, user.id, group.id):
-            await message.answer("❌ Вы уже состоите в этой группе")
+        # Codes that the database already rejected for everyone need no query
+        known = invite_cache.lookup(invite_code)
+        if known and known.blocking_status:
+            await message.answer(REDEEM_ERRORS[known.blocking_status])
             await state.clear()
             return
-
-        # Check group capacity
-        result = await session.execute(
-            select(func.count()).select_from(
-                user_group_association
-            ).where(user_group_association.c.group_id == group.id)
-        )
-        member_count = result.scalar()
-
-        if member_count >= group.max_participants:
-            await message.answer("❌ Группа заполнена")
+        if known and await user_in_group(session, user.id, known.group_id):
+            await message.answer(REDEEM_ERRORS[REDEEM_ALREADY_MEMBER])
             await state.clear()
             return
 
-        # Add user to group
-        stmt = user_group_association.insert().values(
-            user_id=user.id,
-            group_id=group.id
-        )
-        await session.execute(stmt)
+        status, group_id, member_count = await redeem_invite(session, invite_code, user.id)
+        invite_cache.record(invite_code, status, group_id)
+        if status != REDEEM_JOINED:
+            await message.answer(REDEEM_ERRORS.get(status, "❌ Не удалось присоединиться к группе"))
+            await state.clear()
+            return
 
-        # Update invite code usage
-        result = await session.execute(
-            select(InviteCode).where(InviteCode.code == invite_code)
-        )
-        invite = result.scalar_one_or_none()
-        if invite:
-            invite.used_count += 1
-            if invite.used_count >= invite.max_uses:
-                invite.is_active = False
+        # Splice the new member into an already held draw
+        redrawn_event_id = await update_draw_membership(session, group_id, user.id, joined=True)
 
         await session.commit()
+        membership_cache.joined(user.id, group_id)
+        group = await get_group(session, group_id, joinedload(Group.creator))
 
         await message.answer(
-            f"✅ Вы присоединились к группе *{group.name}*!\n\n"
-            f"📋 **Информация:**\n"
-            f"• Участников: {member_count + 1}\n"
-            f"• Организатор: {group.creator.full_name}\n"
-            f"• Описание: {group.description if group.description else 'нет'}\n\n"
-            f"Используйте /my_groups для просмотра ваших групп.",
-            parse_mode="Markdown"
+            templates.GROUP_JOINED.render(
+                name=group.name,
+                member_count=member_count,
+                creator_name=group.creator.full_name,
+                description=group.description if group.description else 'нет'
+            ),
+            parse_mode=templates.PARSE_MODE
         )
 
     await state.clear()
 
+    if redrawn_event_id:
+        await notify_draw_results(redrawn_event_id)
+
 
 @dp.message(Command("join"))
 async def cmd_join(message: types.Message):
@@ -444,47 +472,30 @@ async def cmd_join(message: types.Message):
 @dp.message(Command("my_groups"))
 async def cmd_my_groups(message: types.Message):
     """Show user's groups"""
-    async with get_db_session() as session:
+    async with get_db_session(read_only=True) as session:
         user = await get_user(session, message.from_user.id)
 
         if not user:
             await message.answer("Сначала зарегистрируйтесь через /start")
             return
 
-        groups = await get_user_groups(session, user.id)
+        groups = await get_user_groups_overview(session, user.id)
 
         if not groups:
-            await message.answer(
-                "📋 **У вас пока нет групп**\n\n"
-                "Создайте свою группу или присоединитесь к существующей:\n"
-                "• /create_group - создать новую группу\n"
-                "• /join КОД - присоединиться по коду",
-                parse_mode="Markdown"
-            )
+            await message.answer(templates.NO_GROUPS, parse_mode=templates.PARSE_MODE)
             return
 
-        response = "📋 **Ваши группы:**\n\n"
+        parts = [templates.MY_GROUPS_HEADER]
         keyboard = InlineKeyboardBuilder()
 
-        for group in groups:
-            # Count members
-            result = await session.execute(
-                select(func.count()).select_from(
-                    user_group_association
-                ).where(user_group_association.c.group_id == group.id)
-            )
-            member_count = result.scalar()
-
-            # Get active event
-            event = await get_active_event(session, group.id)
-
-            response += f"🎮 *{group.name}*\n"
-            response += f"   👥 Участников: {member_count}\n"
-            response += f"   🔑 Код: `{group.invite_code}`\n"
-            if event:
-                status_emoji = "🟢" if event.status == 'active' else "🟡"
-                response += f"   {status_emoji} Статус: {event.status}\n"
-            response += "\n"
+        for group, member_count, event_status in groups:
+            parts.append(templates.MY_GROUP_ENTRY.render(
+                name=group.name, member_count=member_count, invite_code=group.invite_code
+            ))
+            if event_status:
+                status_emoji = "🟢" if event_status == 'active' else "🟡"
+                parts.append(templates.MY_GROUP_STATUS.render(emoji=status_emoji, status=event_status))
+            parts.append("\n")
 
             # Add button for group management
             keyboard.button(text=f"👥 {group.name}", callback_data=f"group_{group.id}")
@@ -493,7 +504,7 @@ async def cmd_my_groups(message: types.Message):
         keyboard.button(text="🔗 Присоединиться", callback_data="join_group_init")
         keyboard.adjust(1)
 
-        await message.answer(response, reply_markup=keyboard.as_markup(), parse_mode="Markdown")
+        await message.answer(''.join(parts), reply_markup=keyboard.as_markup(), parse_mode=templates.PARSE_MODE)
 
 
 @dp.callback_query(F.data.startswith("group_"))
@@ -501,8 +512,8 @@ async def group_detail(callback: types.CallbackQuery):
     """Show group details"""
     group_id = int(callback.data.split("_")[1])
 
-    async with get_db_session() as session:
-        group = await get_group(session, group_id)
+    async with get_db_session(read_only=True) as session:
+        group = await get_group(session, group_id, joinedload(Group.creator))
         if not group:
             await callback.answer("❌ Группа не найдена")
             return
@@ -513,55 +524,312 @@ async def group_detail(callback: types.CallbackQuery):
             await callback.answer("❌ Вы не состоите в этой группе")
             return
 
-        # Count members
-        result = await session.execute(
-            select(func.count()).select_from(
-                user_group_association
-            ).where(user_group_association.c.group_id == group.id)
-        )
-        member_count = result.scalar()
-
         # Get active event
         event = await get_active_event(session, group.id)
 
-        response = f"🎮 **Группа: {group.name}**\n\n"
-        response += f"📝 Описание: {group.description if group.description else 'нет'}\n"
-        response += f"👥 Участников: {member_count}\n"
-        response += f"🔑 Код приглашения: `{group.invite_code}`\n"
-        response += f"👑 Создатель: {group.creator.full_name}\n\n"
+        parts = [templates.GROUP_DETAIL.render(
+            name=group.name,
+            description=group.description if group.description else 'нет',
+            member_count=group.member_count,
+            invite_code=group.invite_code,
+            creator_name=group.creator.full_name
+        )]
 
         if event:
-            response += f"🎅 **Активное событие:** {event.name}\n"
-            response += f"📅 Статус: {event.status}\n"
+            parts.append(templates.GROUP_EVENT.render(
+                name=event.name,
+                status=event.status,
+                draw_method=DRAW_METHOD_NAMES.get(event.draw_method, event.draw_method)
+            ))
             if event.start_date:
-                response += f"⏰ Начало: {event.start_date.strftime('%d.%m.%Y %H:%M')}\n"
+                parts.append(templates.EVENT_START.render(date=event.start_date))
             if event.end_date:
-                response += f"🏁 Окончание: {event.end_date.strftime('%d.%m.%Y %H:%M')}\n"
-
-        keyboard = InlineKeyboardBuilder()
+                parts.append(templates.EVENT_END.render(date=event.end_date))
 
         # Different buttons for admin and regular members
         if group.creator_id == user.id or user.is_global_admin:
-            keyboard.button(text="⚙️ Управление группой", callback_data=f"manage_group_{group.id}")
-            keyboard.button(text="👥 Участники", callback_data=f"group_members_{group.id}")
-            keyboard.button(text="🎲 Запустить жеребьевку", callback_data=f"start_draw_{group.id}")
-            keyboard.button(text="📅 Установить даты", callback_data=f"set_dates_{group.id}")
+            keyboard = templates.GROUP_ORGANIZER_KEYBOARD
         else:
-            keyboard.button(text="👥 Участники", callback_data=f"group_members_{group.id}")
-            keyboard.button(text="📊 Статистика", callback_data=f"group_stats_{group.id}")
-
-        keyboard.button(text="◀️ Назад к группам", callback_data="back_to_groups")
-        keyboard.adjust(2)
+            keyboard = templates.GROUP_MEMBER_KEYBOARD
 
         await callback.message.edit_text(
-            response,
-            reply_markup=keyboard.as_markup(),
-            parse_mode="Markdown"
+            ''.join(parts),
+            reply_markup=keyboard.render(group_id=group.id),
+            parse_mode=templates.PARSE_MODE
+        )
+
+    await callback.answer()
+
+
+# ==================== DRAW ====================
+
+DRAW_METHOD_NAMES = {
+    DRAW_METHOD_AUTO: "обычная",
+    DRAW_METHOD_CYCLE: "одна цепочка",
+}
+
+
+@dp.callback_query(F.data.startswith("draw_method_"))
+async def toggle_draw_method(callback: types.CallbackQuery):
+    """Switch event between regular draw and single chain"""
+    group_id = int(callback.data.split("_")[2])
+
+    async with get_db_session() as session:
+        group = await get_group(session, group_id)
+        user = await get_user(session, callback.from_user.id)
+        if not group or not user or (group.creator_id != user.id and not user.is_global_admin):
+            await callback.answer("⛔ Нет прав!")
+            return
+
+        event = await get_active_event(session, group.id)
+        if not event or event.status != 'waiting':
+            await callback.answer("❌ Режим можно изменить только до жеребьевки", show_alert=True)
+            return
+
+        event.draw_method = DRAW_METHOD_CYCLE if event.draw_method != DRAW_METHOD_CYCLE else DRAW_METHOD_AUTO
+        await session.commit()
+
+        await callback.answer(
+            f"🎲 Режим жеребьевки: {DRAW_METHOD_NAMES[event.draw_method]}",
+            show_alert=True
         )
 
+
+# Telegram allows at most 100 buttons per keyboard
+EXCLUSION_PICK_LIMIT = 90
+
+
+@dp.callback_query(F.data.startswith("exclude_"))
+async def add_exclusion(callback: types.CallbackQuery):
+    """Let the organizer pick two members who must not draw each other"""
+    # exclude_{group_id}, then exclude_{group_id}_{user1_id}, then exclude_{group_id}_{user1_id}_{user2_id}
+    group_id, *picked = (int(part) for part in callback.data.split("_")[1:])
+
+    async with get_db_session() as session:
+        group = await get_group(session, group_id)
+        user = await get_user(session, callback.from_user.id)
+        if not group or not user or (group.creator_id != user.id and not user.is_global_admin):
+            await callback.answer("⛔ Нет прав!")
+            return
+
+        event = await get_active_event(session, group.id)
+        if not event or event.status != 'waiting':
+            await callback.answer("❌ Исключения можно задать только до жеребьевки", show_alert=True)
+            return
+
+        if len(picked) < 2:
+            result = await session.execute(
+                select(User.id, User.full_name)
+                .join(user_group_association, user_group_association.c.user_id == User.id)
+                .where(user_group_association.c.group_id == group.id, User.id.not_in(picked))
+                .order_by(User.full_name)
+                .limit(EXCLUSION_PICK_LIMIT)
+            )
+            keyboard = InlineKeyboardBuilder()
+            for member_id, full_name in result.all():
+                keyboard.button(text=full_name, callback_data="_".join(map(str, ["exclude", group.id, *picked, member_id])))
+            keyboard.adjust(2)
+
+            prompt = (
+                "🚫 Выберите участника, для которого нужно исключение:" if not picked
+                else "🚫 Выберите второго участника. Эти двое не будут дарить подарки друг другу:"
+            )
+            await callback.message.answer(prompt, reply_markup=keyboard.as_markup())
+            await callback.answer()
+            return
+
+        if not set(picked) <= set(await get_group_member_ids(session, group.id)):
+            await callback.answer("❌ Участник уже покинул группу", show_alert=True)
+            return
+
+        pairs = {(user1_id, user2_id) for user1_id, user2_id, _ in await get_exclusion_rules(session, event.id)}
+        if (picked[0], picked[1]) in pairs or (picked[1], picked[0]) in pairs:
+            await callback.answer("ℹ️ Для этих участников исключение уже задано", show_alert=True)
+            return
+
+        try:
+            report = await add_exclusion_rule(session, event, picked[0], picked[1], strict=True)
+        except DrawAlreadyExistsError:
+            await callback.answer("❌ Исключения можно задать только до жеребьевки", show_alert=True)
+            return
+        if report.blocking:
+            result = await session.execute(select(User.full_name).where(User.id.in_(report.blocking)))
+            names = "\n".join(f"• {name}" for name in result.scalars().all())
+            await callback.message.answer(
+                f"❌ Исключение не добавлено: с ним жеребьевка станет невозможной.\n\n"
+                f"Этим участникам не хватит допустимых получателей:\n{names}"
+            )
+        elif report.total < MIN_DRAW_PARTICIPANTS:
+            await callback.message.answer(
+                f"✅ Исключение добавлено.\n\n"
+                f"Для жеребьевки нужно минимум {MIN_DRAW_PARTICIPANTS} участника."
+            )
+        else:
+            await callback.message.answer("✅ Исключение добавлено, жеребьевка по-прежнему возможна.")
     await callback.answer()
 
 
+@dp.callback_query(F.data.startswith("start_draw_"))
+async def start_draw(callback: types.CallbackQuery):
+    """Run the draw for group's active event"""
+    group_id = int(callback.data.split("_")[2])
+
+    async with get_db_session() as session:
+        group = await get_group(session, group_id)
+        if not group:
+            await callback.answer("❌ Группа не найдена")
+            return
+
+        user = await get_user(session, callback.from_user.id)
+        if not user or (group.creator_id != user.id and not user.is_global_admin):
+            await callback.answer("⛔ Нет прав!")
+            return
+
+        event = await get_active_event(session, group.id)
+        if not event:
+            await callback.answer("❌ В группе нет активного события", show_alert=True)
+            return
+
+        if event.status != 'waiting':
+            await callback.answer("❌ Жеребьевка уже проведена", show_alert=True)
+            return
+
+        try:
+            assignment = await run_draw(session, event, draw_executor)
+        except DrawAlreadyExistsError:
+            await callback.answer("❌ Жеребьевка уже проведена", show_alert=True)
+            return
+        except NotEnoughParticipantsError:
+            await callback.answer(
+                f"❌ Для жеребьевки нужно минимум {MIN_DRAW_PARTICIPANTS} участника",
+                show_alert=True
+            )
+            return
+        except DrawInfeasibleError as e:
+            result = await session.execute(select(User.full_name).where(User.id.in_(e.blocking)))
+            names = "\n".join(f"• {name}" for name in result.scalars().all())
+            await callback.message.answer(
+                f"❌ Правила исключений не позволяют провести жеребьевку.\n\n"
+                f"Этим участникам не хватает допустимых получателей:\n{names}\n\n"
+                f"Ослабьте исключения для кого-то из них."
+            )
+            await callback.answer()
+            return
+        except DrawError as e:
+            logger.error(f"Draw failed for event {event.id}: {e}")
+            await callback.answer("❌ Не удалось провести жеребьевку", show_alert=True)
+            return
+
+        event_id = event.id
+
+    await callback.message.answer(
+        templates.DRAW_HELD.render(name=group.name, count=len(assignment)),
+        parse_mode=templates.PARSE_MODE
+    )
+    await callback.answer()
+    await notify_draw_results(event_id)
+
+
+# notified flags are committed this often, so a crash re-sends at most one batch
+NOTIFY_BATCH_SIZE = 50
+
+
+async def mark_notified(result_ids: List[int]):
+    """Commit notified flags of sent draw results"""
+    async with get_db_session() as session:
+        await session.execute(update(DrawResult).where(DrawResult.id.in_(result_ids)).values(notified=True))
+
+
+async def notify_draw_results(event_id: int):
+    """Send every santa their receiver.
+
+    Rows are loaded up front so no connection is held while messages go out.
+    """
+    santa, receiver = aliased(User), aliased(User)
+    async with get_db_session() as session:
+        result = await session.execute(
+            select(DrawResult.id, santa.telegram_id, receiver.full_name, receiver.wishlist, receiver.contact_info)
+            .join(santa, santa.id == DrawResult.santa_id)
+            .join(receiver, receiver.id == DrawResult.receiver_id)
+            .where(DrawResult.event_id == event_id, DrawResult.notified.is_(False))
+        )
+        pending = result.all()
+
+    sent = []
+    for result_id, telegram_id, full_name, wishlist, contact_info in pending:
+        text = templates.DRAW_RESULT.render(full_name=full_name, wishlist=wishlist)
+        if contact_info:
+            text += templates.DRAW_RESULT_CONTACTS.render(contact_info=contact_info)
+
+        try:
+            await bot.send_message(chat_id=telegram_id, text=text, parse_mode=templates.PARSE_MODE)
+            sent.append(result_id)
+            await asyncio.sleep(0.1)  # Rate limiting
+        except Exception as e:
+            logger.error(f"Failed to notify santa {telegram_id}: {e}")
+
+        if len(sent) >= NOTIFY_BATCH_SIZE:
+            await mark_notified(sent)
+            sent = []
+
+    if sent:
+        await mark_notified(sent)
+
+
+@dp.callback_query(F.data.startswith("leave_group_"))
+async def leave_group(callback: types.CallbackQuery):
+    """Leave group, reconnecting the draw if it was already held"""
+    group_id = int(callback.data.split("_")[2])
+
+    async with get_db_session() as session:
+        group = await get_group(session, group_id)
+        user = await get_user(session, callback.from_user.id)
+        if not group or not user or not await user_in_group(session, user.id, group_id):
+            await callback.answer("❌ Вы не состоите в этой группе")
+            return
+
+        if group.creator_id == user.id:
+            await callback.answer("❌ Создатель не может покинуть группу", show_alert=True)
+            return
+
+        await remove_group_member(session, group_id, user.id)
+        redrawn_event_id = await update_draw_membership(session, group_id, user.id, joined=False)
+        await session.commit()
+        membership_cache.left(user.id, group_id)
+        invite_cache.group_changed(group_id)
+
+        await callback.message.edit_text(templates.GROUP_LEFT.render(name=group.name), parse_mode=templates.PARSE_MODE)
+
+    await callback.answer()
+
+    if redrawn_event_id:
+        await notify_draw_results(redrawn_event_id)
+
+
+async def update_draw_membership(session: AsyncSession, group_id: int, user_id: int, joined: bool) -> Optional[int]:
+    """Repair a held draw after a member joined or left, returns event id if santas need notifying"""
+    event = await get_active_event(session, group_id)
+    if not event:
+        return None
+    # Row lock: a draw being saved either sees this membership change or commits before we read its status
+    status = (await session.execute(
+        select(Event.status).where(Event.id == event.id).with_for_update()
+    )).scalar_one()
+    if status != 'active':
+        return None
+
+    try:
+        if joined:
+            changes = await add_member_to_draw(session, event, user_id)
+        else:
+            changes = await remove_member_from_draw(session, event, user_id)
+    except DrawError as e:
+        logger.warning(f"Could not update draw of event {event.id} for user {user_id}: {e}")
+        return None
+
+    return event.id if changes else None
+
+
 # ==================== ADMIN COMMANDS ====================
 
 @dp.message(Command("admin"))
@@ -571,61 +839,176 @@ async def cmd_admin(message: types.Message):
         await message.answer("⛔ У вас нет прав администратора!")
         return
 
-    keyboard = InlineKeyboardBuilder()
-    keyboard.button(text="📅 Установить даты", callback_data="admin_set_dates")
-    keyboard.button(text="👥 Участники", callback_data="admin_view_users")
-    keyboard.button(text="🎲 Запустить жеребьевку", callback_data="admin_start_draw")
-    keyboard.button(text="📊 Статистика", callback_data="admin_stats")
-    keyboard.button(text="📢 Рассылка", callback_data="admin_broadcast")
-    keyboard.button(text="🔍 Найти пару", callback_data="admin_find_pair")
-    keyboard.button(text="📦 Группы", callback_data="admin_groups")
-    keyboard.adjust(2)
-
     await message.answer(
-        "👑 **Панель администратора**\n\n"
-        "Выберите действие:",
-        reply_markup=keyboard.as_markup(),
-        parse_mode="Markdown"
+        templates.ADMIN_PANEL,
+        reply_markup=templates.ADMIN_PANEL_KEYBOARD.render(),
+        parse_mode=templates.PARSE_MODE
     )
 
 
+ADMIN_GROUPS_PAGE_SIZE = 20
+# Long group and creator names are cut so a page of entries stays readable
+ADMIN_GROUP_FIELD_LIMIT = 64
+
+
+async def get_groups_page(session: AsyncSession, after_id: Optional[int] = None,
+                          before_id: Optional[int] = None,
+                          limit: int = ADMIN_GROUPS_PAGE_SIZE) -> Tuple[list, bool]:
+    """Get one page of groups ordered by id, with creator name and member count.
+
+    Keyset pagination: the page starts after `after_id` or ends before
+    `before_id`. Returns the rows and whether more groups lie beyond the page.
+    """
+    query = (
+        select(Group.id, Group.name, Group.invite_code, User.full_name, Group.member_count)
+        .outerjoin(User, User.id == Group.creator_id)
+        .limit(limit + 1)
+    )
+    if before_id is not None:
+        query = query.where(Group.id < before_id).order_by(Group.id.desc())
+    else:
+        if after_id is not None:
+            query = query.where(Group.id > after_id)
+        query = query.order_by(Group.id)
+
+    rows = (await session.execute(query)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if before_id is not None:
+        rows.reverse()
+    return rows, has_more
+
+
 @dp.callback_query(F.data == "admin_groups")
+@dp.callback_query(F.data.startswith("admin_groups_after_"))
+@dp.callback_query(F.data.startswith("admin_groups_before_"))
 async def admin_groups_list(callback: types.CallbackQuery):
-    """Show all groups for admin"""
+    """Show groups for admin, one page at a time"""
     if not is_admin(callback.from_user.id):
         await callback.answer("⛔ Нет прав!")
         return
 
-    async with get_db_session() as session:
-        result = await session.execute(select(Group))
-        groups = result.scalars().all()
+    after_id = before_id = None
+    if callback.data.startswith("admin_groups_after_"):
+        after_id = int(callback.data.rsplit("_", 1)[1])
+    elif callback.data.startswith("admin_groups_before_"):
+        before_id = int(callback.data.rsplit("_", 1)[1])
 
-        if not groups:
+    async with get_db_session(read_only=True) as session:
+        groups, has_more = await get_groups_page(session, after_id, before_id)
+
+    if not groups:
+        if after_id is None and before_id is None:
             await callback.message.answer("❌ Нет созданных групп")
             await callback.answer()
-            return
-
-        response = "📦 **Все группы:**\n\n"
+        else:
+            await callback.answer("Больше групп нет")
+        return
 
-        for group in groups:
-            # Count members
-            result = await session.execute(
-                select(func.count()).select_from(
-                    user_group_association
-                ).where(user_group_association.c.group_id == group.id)
-            )
-            member_count = result.scalar()
+    entries = [
+        templates.ADMIN_GROUP_ENTRY.render(
+            name=templates.shorten(name, ADMIN_GROUP_FIELD_LIMIT),
+            member_count=member_count,
+            invite_code=invite_code,
+            creator_name=templates.shorten(creator_name, ADMIN_GROUP_FIELD_LIMIT)
+        )
+        for _, name, invite_code, creator_name, member_count in groups
+    ]
+
+    # Fit the message limit, dropping the entries farthest from where paging came from
+    length = len(templates.ADMIN_GROUPS_HEADER)
+    fits = 0
+    for entry in (entries if before_id is None else reversed(entries)):
+        if length + len(entry) > templates.MAX_MESSAGE_LENGTH:
+            break
+        length += len(entry)
+        fits += 1
+    cut = fits < len(entries)
+    if before_id is None:
+        groups, entries = groups[:fits], entries[:fits]
+    else:
+        groups, entries = groups[len(groups) - fits:], entries[len(entries) - fits:]
+    response = templates.ADMIN_GROUPS_HEADER + ''.join(entries)
 
-            response += f"🎮 *{group.name}*\n"
-            response += f"   👥 Участников: {member_count}\n"
-            response += f"   🔑 Код: `{group.invite_code}`\n"
-            response += f"   👑 Создатель: {group.creator.full_name}\n\n"
+    # Going back always has a previous page, going forward always has a next one
+    has_prev = (has_more or cut) if before_id is not None else after_id is not None
+    has_next = (has_more or cut) if before_id is None else True
 
-        await callback.message.edit_text(response, parse_mode="Markdown")
+    keyboard = InlineKeyboardBuilder()
+    if has_prev:
+        keyboard.button(text="⬅️ Назад", callback_data=f"admin_groups_before_{groups[0][0]}")
+    if has_next:
+        keyboard.button(text="Вперед ➡️", callback_data=f"admin_groups_after_{groups[-1][0]}")
 
+    await callback.message.edit_text(response, reply_markup=keyboard.as_markup(), parse_mode=templates.PARSE_MODE)
     await callback.answer()
 
 
+def format_pool_stats(title: str, stats: dict) -> str:
+    """One pool's section of /db_stats"""
+    return (
+        f"{title}\n\n"
+        f"• Размер: {stats['size']}, занято: {stats['checked_out']}, overflow: {stats['overflow']}\n"
+        f"• Выдач соединений: {stats['checkouts']}, таймаутов: {stats['timeouts']}\n"
+        f"• Ожидание: среднее {stats['avg_wait_ms']:.1f} мс, p50 {stats['p50_wait_ms']:.1f} мс, "
+        f"p95 {stats['p95_wait_ms']:.1f} мс, макс {stats['max_wait_ms']:.1f} мс\n\n"
+    )
+
+
+@dp.message(Command("db_stats"))
+async def cmd_db_stats(message: types.Message):
+    """Database pool usage, checkout wait times and cache hit rates"""
+    if not is_admin(message.from_user.id):
+        await message.answer("⛔ У вас нет прав администратора!")
+        return
+
+    pools = format_pool_stats("🗄 Пул соединений", get_pool_stats())
+    if replica_engine is not None:
+        pools += format_pool_stats("🗄 Пул соединений реплики", get_pool_stats(replica_engine))
+    users = user_cache.stats()
+    memberships = membership_cache.stats()
+    invites = invite_cache.stats()
+    await message.answer(
+        pools +
+        f"👤 Кэш пользователей\n\n"
+        f"• Записей: {users['size']} из {users['maxsize']}, вытеснено: {users['evictions']}\n"
+        f"• Попаданий: {users['hits']}, промахов: {users['misses']} ({users['hit_rate']:.0%})\n\n"
+        f"👥 Кэш участия в группах\n\n"
+        f"• Записей: {memberships['size']} из {memberships['maxsize']}, вытеснено: {memberships['evictions']}\n"
+        f"• Попаданий: {memberships['hits']}, промахов: {memberships['misses']} ({memberships['hit_rate']:.0%})\n\n"
+        f"🔑 Кэш кодов приглашения\n\n"
+        f"• Записей: {invites['size']} из {invites['maxsize']}\n"
+        f"• Отклонено фильтром Блума: {invites['bloom_rejections']}\n"
+        f"• Попаданий: {invites['hits']}, промахов: {invites['misses']} ({invites['hit_rate']:.0%})"
+    )
+
+
+@dp.message(Command("verify_draw"))
+async def cmd_verify_draw(message: types.Message):
+    """Replay event's draw from its seed and compare with stored results"""
+    if not is_admin(message.from_user.id):
+        await message.answer("⛔ У вас нет прав администратора!")
+        return
+
+    args = message.text.split()
+    if len(args) < 2 or not args[1].isdigit():
+        await message.answer("Использование: `/verify_draw ID_СОБЫТИЯ`", parse_mode="Markdown")
+        return
+
+    async with get_db_session() as session:
+        replay = await replay_draw(session, int(args[1]))
+
+    if replay is None:
+        await message.answer("❌ У события нет жеребьевки с сохраненным seed")
+    elif replay.matches:
+        await message.answer(f"✅ Жеребьевка события {replay.event_id} воспроизведена: {len(replay.stored)} пар совпадают")
+    else:
+        await message.answer(
+            f"⚠️ Жеребьевка события {replay.event_id} не совпадает с сохраненной!\n"
+            f"Расхождений: {len(replay.mismatched_santas)} из {len(replay.stored)}"
+        )
+
+
 # ==================== SCHEDULER FUNCTIONS ====================
 
 async def schedule_reminders(event: Event):
@@ -634,7 +1017,9 @@ async def schedule_reminders(event: Event):
         return
 
     # Remove old jobs for this event
-    scheduler.remove_all_jobs()
+    for job in scheduler.get_jobs():
+        if job.func is send_reminder and job.args[0] == event.id:
+            job.remove()
 
     # Reminder 1 day before start
     reminder_date = event.start_date - timedelta(days=1)
@@ -685,7 +1070,7 @@ async def schedule_reminders(event: Event):
 
 async def send_reminder(event_id: int, reminder_type: str):
     """Send reminder to all participants"""
-    async with get_db_session() as session:
+    async with get_db_session(read_only=True) as session:
         event = await session.get(Event, event_id)
         if not event:
             return
@@ -732,13 +1117,83 @@ async def send_reminder(event_id: int, reminder_type: str):
                 logger.error(f"Failed to send reminder to {user.telegram_id}: {e}")
 
 
+async def run_scheduled_draws():
+    """Draw every event whose start date has come and notify santas"""
+    drawn, failed = await run_due_draws(draw_executor)
+    if drawn:
+        logger.info(f"Scheduled draws completed for events: {drawn}")
+    for event_id in drawn:
+        await notify_draw_results(event_id)
+    if failed:
+        await notify_draw_failures(failed)
+
+
+def describe_draw_error(error: Exception) -> str:
+    """Why a draw failed, for the organizer"""
+    if isinstance(error, NotEnoughParticipantsError):
+        return f"для жеребьевки нужно минимум {MIN_DRAW_PARTICIPANTS} участника"
+    if isinstance(error, DrawInfeasibleError):
+        return "правила исключений не позволяют провести жеребьевку"
+    return "внутренняя ошибка"
+
+
+async def notify_draw_failures(failed: Dict[int, Exception]):
+    """Tell organizers that the scheduled draw of their event did not happen"""
+    async with get_db_session() as session:
+        result = await session.execute(
+            select(Event.id, Event.name, Group.name, User.telegram_id)
+            .join(Group, Group.id == Event.group_id)
+            .join(User, User.id == Group.creator_id)
+            .where(Event.id.in_(list(failed)))
+        )
+        organizers = result.all()
+
+    for event_id, event_name, group_name, telegram_id in organizers:
+        try:
+            await bot.send_message(
+                chat_id=telegram_id,
+                text=(
+                    f"❌ Жеребьевка события «{event_name}» в группе «{group_name}» не состоялась: "
+                    f"{describe_draw_error(failed[event_id])}.\n\n"
+                    f"Автоматически она больше не запустится. Исправьте причину и запустите "
+                    f"жеребьевку вручную из меню группы."
+                )
+            )
+            await asyncio.sleep(0.1)  # Rate limiting
+        except Exception as e:
+            logger.error(f"Failed to notify organizer {telegram_id} of event {event_id}: {e}")
+
+
 # ==================== BOT STARTUP ====================
 
+async def refresh_invite_codes():
+    """Rebuild the invite code Bloom filter, catching up on codes whose `added` publication was missed"""
+    # From the primary: a lagging replica would leave out the newest codes
+    async with get_db_session() as session:
+        result = await session.execute(select(Group.invite_code))
+        invite_cache.load(result.scalars().all())
+
+
 async def on_startup():
     """Actions on bot startup"""
     logger.info("Bot starting up...")
 
     # Start scheduler
+    scheduler.add_job(
+        refresh_invite_codes,
+        IntervalTrigger(seconds=INVITE_BLOOM_REFRESH, timezone=TIMEZONE),
+        id="refresh_invite_codes",
+        next_run_time=datetime.now(pytz.timezone(TIMEZONE)),
+        max_instances=1,
+        coalesce=True
+    )
+    scheduler.add_job(
+        run_scheduled_draws,
+        IntervalTrigger(seconds=DRAW_CHECK_INTERVAL, timezone=TIMEZONE),
+        id="scheduled_draws",
+        max_instances=1,
+        coalesce=True
+    )
     scheduler.start()
 
     # Notify admin
@@ -755,6 +1210,7 @@ async def on_shutdown():
     """Actions on bot shutdown"""
     logger.info("Bot shutting down...")
     scheduler.shutdown()
+    draw_executor.shutdown(wait=False, cancel_futures=True)
 
 
 async def main():
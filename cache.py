@@ -0,0 +1,301 @@
+"""
+Process-local caches in front of hot database lookups.
+
+Entries are plain immutable snapshots, never ORM instances, so they can be
+shared between sessions and handlers.
+"""
+import hashlib
+import itertools
+import math
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, FrozenSet, Hashable, Iterable, List, Optional
+
+from config import USER_CACHE_SIZE, USER_CACHE_TTL, MEMBERSHIP_CACHE_SIZE, MEMBERSHIP_CACHE_TTL
+from config import INVITE_CACHE_SIZE, INVITE_CACHE_TTL, INVITE_BLOOM_CAPACITY
+from database import User, REDEEM_JOINED, REDEEM_NOT_FOUND, REDEEM_ALREADY_MEMBER
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire after `ttl` seconds"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Cached value or None if missing or expired"""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self.entries[key]
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        """Store value, evicting the least recently used entry when full"""
+        self.entries[key] = (value, time.monotonic() + self.ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        """Drop cached value, if any"""
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+@dataclass(frozen=True, slots=True)
+class UserSnapshot:
+    """Read-only copy of a users row, safe to keep outside the session"""
+    id: int
+    telegram_id: int
+    username: Optional[str]
+    full_name: str
+    wishlist: str
+    contact_info: Optional[str]
+    is_admin: bool
+    is_global_admin: bool
+    is_banned: bool
+    registered_at: Optional[datetime]
+
+    @classmethod
+    def from_user(cls, user: User) -> 'UserSnapshot':
+        return cls(
+            id=user.id,
+            telegram_id=user.telegram_id,
+            username=user.username,
+            full_name=user.full_name,
+            wishlist=user.wishlist,
+            contact_info=user.contact_info,
+            is_admin=user.is_admin,
+            is_global_admin=user.is_global_admin,
+            is_banned=user.is_banned,
+            registered_at=user.registered_at,
+        )
+
+
+# Keyed by telegram_id. Paths that change a users row must invalidate it;
+# other bot processes see the change once their entry expires.
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+
+class InvalidationBus:
+    """In-process pub/sub stand-in for the channel bot replicas use to invalidate each other's caches.
+
+    Replicas in separate processes need a real transport with the same
+    publish/subscribe shape (Redis pub/sub, Postgres LISTEN/NOTIFY).
+    """
+
+    def __init__(self):
+        self.subscribers: Dict[str, List[Callable[[dict], None]]] = defaultdict(list)
+
+    def subscribe(self, channel: str, callback: Callable[[dict], None]):
+        self.subscribers[channel].append(callback)
+
+    def publish(self, channel: str, message: dict):
+        for callback in self.subscribers[channel]:
+            callback(message)
+
+
+MEMBERSHIP_CHANNEL = 'membership'
+
+_replica_ids = itertools.count(1)
+
+
+class MembershipCache:
+    """Group ids of each user as a frozenset, so membership checks need no query.
+
+    Every user has a version, bumped by each local or remote change. A set
+    loaded from the database is stored only if the version did not move while
+    it was loading, so a load racing with a join or leave cannot cache stale
+    membership.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, bus: InvalidationBus):
+        self.groups = TTLCache(maxsize, ttl)
+        self.versions: Dict[int, int] = defaultdict(int)
+        self.bus = bus
+        self.replica_id = next(_replica_ids)
+        bus.subscribe(MEMBERSHIP_CHANNEL, self._on_message)
+
+    def get(self, user_id: int) -> Optional[FrozenSet[int]]:
+        """Cached group ids of user, None if they have to be loaded"""
+        return self.groups.get(user_id)
+
+    def version(self, user_id: int) -> int:
+        """Take before loading, pass to put()"""
+        return self.versions.get(user_id, 0)
+
+    def put(self, user_id: int, group_ids: Iterable[int], version: int) -> FrozenSet[int]:
+        """Store loaded group ids unless membership changed since `version` was taken"""
+        group_ids = frozenset(group_ids)
+        if self.versions.get(user_id, 0) == version:
+            self.groups.put(user_id, group_ids)
+        return group_ids
+
+    def joined(self, user_id: int, group_id: int):
+        """User joined group, call after commit"""
+        self._changed(user_id, lambda group_ids: group_ids | {group_id})
+
+    def left(self, user_id: int, group_id: int):
+        """User left group, call after commit"""
+        self._changed(user_id, lambda group_ids: group_ids - {group_id})
+
+    def _changed(self, user_id: int, update: Callable[[FrozenSet[int]], FrozenSet[int]]):
+        self.versions[user_id] += 1
+        group_ids = self.groups.get(user_id)
+        if group_ids is not None:
+            self.groups.put(user_id, update(group_ids))
+        self.bus.publish(MEMBERSHIP_CHANNEL, {
+            'user_id': user_id,
+            'version': self.versions[user_id],
+            'origin': self.replica_id,
+        })
+
+    def _on_message(self, message: dict):
+        """Other replica changed user's membership: drop our copy"""
+        if message['origin'] == self.replica_id:
+            return
+        user_id = message['user_id']
+        self.versions[user_id] = max(self.versions[user_id] + 1, message['version'])
+        self.groups.invalidate(user_id)
+
+    def stats(self) -> dict:
+        return self.groups.stats()
+
+
+class BloomFilter:
+    """Set membership with no false negatives and about `error_rate` false positives at `capacity` items"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+@dataclass(frozen=True, slots=True)
+class InviteState:
+    """What the last redemption attempt learned about an invite code"""
+    group_id: Optional[int]
+    # Status that rejects every user (closed, full, expired, not found), None if the code worked
+    blocking_status: Optional[str]
+
+
+INVITES_CHANNEL = 'invites'
+
+
+class InviteCache:
+    """Resolves invite codes in memory so blocked and unknown codes are rejected without a query.
+
+    A Bloom filter over all issued codes rejects codes it has never seen as
+    not_found. Codes issued by any bot process reach it through the `added`
+    publication, and a periodic rebuild from the primary catches up on any
+    that were missed. Every code also remembers the outcome of its last
+    redemption for `ttl` seconds.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, capacity: int, bus: InvalidationBus):
+        self.capacity = capacity
+        self.bloom: Optional[BloomFilter] = None
+        # Codes added since the last rebuild, which may be missing from its snapshot
+        self.recent: List[str] = []
+        self.states = TTLCache(maxsize, ttl)
+        self.bloom_rejections = 0
+        self.bus = bus
+        self.replica_id = next(_replica_ids)
+        bus.subscribe(INVITES_CHANNEL, self._on_message)
+
+    def load(self, codes: Iterable[str]):
+        """Rebuild the Bloom filter from every issued code"""
+        codes = list(codes) + self.recent
+        bloom = BloomFilter(max(self.capacity, 2 * len(codes)))
+        for code in codes:
+            bloom.add(code)
+        self.bloom = bloom
+        self.recent = []
+
+    def lookup(self, code: str) -> Optional[InviteState]:
+        """Known state of code, None if it has to be redeemed in the database to find out"""
+        if self.bloom is not None and code not in self.bloom:
+            self.bloom_rejections += 1
+            return InviteState(group_id=None, blocking_status=REDEEM_NOT_FOUND)
+        return self.states.get(code)
+
+    def record(self, code: str, status: str, group_id: Optional[int]):
+        """Remember outcome of a redemption, as reported by the database"""
+        blocking = None if status in (REDEEM_JOINED, REDEEM_ALREADY_MEMBER) else status
+        self.states.put(code, InviteState(group_id=group_id, blocking_status=blocking))
+
+    def added(self, code: str):
+        """New code was issued"""
+        self._apply({'added': code})
+        self.bus.publish(INVITES_CHANNEL, {'added': code, 'origin': self.replica_id})
+
+    def group_changed(self, group_id: int):
+        """Group's capacity, registration or invites changed: forget what its codes said"""
+        self._apply({'group_id': group_id})
+        self.bus.publish(INVITES_CHANNEL, {'group_id': group_id, 'origin': self.replica_id})
+
+    def _apply(self, message: dict):
+        if 'added' in message:
+            self.recent.append(message['added'])
+            if self.bloom is not None:
+                self.bloom.add(message['added'])
+            self.states.invalidate(message['added'])
+        else:
+            for code, (state, _) in list(self.states.entries.items()):
+                if state.group_id == message['group_id']:
+                    self.states.invalidate(code)
+
+    def _on_message(self, message: dict):
+        if message['origin'] != self.replica_id:
+            self._apply(message)
+
+    def stats(self) -> dict:
+        return {**self.states.stats(), 'bloom_rejections': self.bloom_rejections}
+
+
+invalidation_bus = InvalidationBus()
+membership_cache = MembershipCache(MEMBERSHIP_CACHE_SIZE, MEMBERSHIP_CACHE_TTL, invalidation_bus)
+invite_cache = InviteCache(INVITE_CACHE_SIZE, INVITE_CACHE_TTL, INVITE_BLOOM_CAPACITY, invalidation_bus)
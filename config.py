@@ -16,6 +16,16 @@ POSTGRES_DB = os.getenv('POSTGRES_DB', 'secret_santa')
 DATABASE_URL = f'postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}'
 SYNC_DATABASE_URL = f'postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}'
 
+# Read replica for read-only handlers, disabled when no host is set
+POSTGRES_REPLICA_HOST = os.getenv('POSTGRES_REPLICA_HOST')
+POSTGRES_REPLICA_PORT = os.getenv('POSTGRES_REPLICA_PORT', POSTGRES_PORT)
+REPLICA_DATABASE_URL = (
+    f'postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}'
+    f'@{POSTGRES_REPLICA_HOST}:{POSTGRES_REPLICA_PORT}/{POSTGRES_DB}'
+) if POSTGRES_REPLICA_HOST else None
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', 5))
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv('REPLICA_LAG_CHECK_INTERVAL', 10))
+
 # Timezone
 TIMEZONE = os.getenv('TIMEZONE', 'Europe/Moscow')
 
@@ -31,4 +41,28 @@ DEFAULT_PRICE_LIMIT = os.getenv('DEFAULT_PRICE_LIMIT', "3000 рублей")
 # Database Pool
 DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 20))
 DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 40))
-DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 3600))
\ No newline at end of file
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 3600))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 30))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', 100))
+
+# Draws
+DRAW_WORKERS = int(os.getenv('DRAW_WORKERS', os.cpu_count() or 1))
+DRAW_CHECK_INTERVAL = int(os.getenv('DRAW_CHECK_INTERVAL', 60))
+
+# Caches
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', 300))
+MEMBERSHIP_CACHE_SIZE = int(os.getenv('MEMBERSHIP_CACHE_SIZE', 10000))
+MEMBERSHIP_CACHE_TTL = float(os.getenv('MEMBERSHIP_CACHE_TTL', 300))
+INVITE_CACHE_SIZE = int(os.getenv('INVITE_CACHE_SIZE', 10000))
+INVITE_CACHE_TTL = float(os.getenv('INVITE_CACHE_TTL', 60))
+INVITE_BLOOM_CAPACITY = int(os.getenv('INVITE_BLOOM_CAPACITY', 100000))
+INVITE_BLOOM_REFRESH = int(os.getenv('INVITE_BLOOM_REFRESH', 300))
+
+# FSM storage: 'postgres' (persistent, write-behind), 'redis' (needs the redis package) or 'memory'
+FSM_STORAGE = os.getenv('FSM_STORAGE', 'postgres')
+FSM_FLUSH_INTERVAL = float(os.getenv('FSM_FLUSH_INTERVAL', 1))
+FSM_CACHE_SIZE = int(os.getenv('FSM_CACHE_SIZE', 10000))
+# Seconds a written FSM record is trusted before it is read again, bounds staleness across bot processes
+FSM_RECORD_TTL = float(os.getenv('FSM_RECORD_TTL', 5))
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
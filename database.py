@@ -1,29 +1,188 @@
 from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Table, UniqueConstraint, \
-    BigInteger, Index, CheckConstraint, func
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    BigInteger, Index, CheckConstraint
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship
-from sqlalchemy import text
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy import text, update, delete
+from sqlalchemy.exc import IntegrityError, TimeoutError as PoolTimeoutError
+import asyncio
+from collections import deque
 from datetime import datetime
+import logging
 import pytz
 import secrets
 import string
-from typing import AsyncGenerator
+import time
+from typing import AsyncGenerator, Optional, Tuple
 from contextlib import asynccontextmanager
 
-from config import DATABASE_URL, SYNC_DATABASE_URL, TIMEZONE
+from config import DATABASE_URL, TIMEZONE
+from config import REPLICA_DATABASE_URL, REPLICA_MAX_LAG, REPLICA_LAG_CHECK_INTERVAL
+from config import DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE, DB_POOL_TIMEOUT, DB_STATEMENT_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class PoolStats:
+    """Connection checkout wait times, to size the pool from real load"""
+
+    def __init__(self, window: int = 1000):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.recent = deque(maxlen=window)
+
+    def record(self, wait: float, timed_out: bool = False):
+        self.checkouts += 1
+        self.timeouts += timed_out
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.recent.append(wait)
+
+    def snapshot(self) -> dict:
+        recent = sorted(self.recent)
+
+        def percentile(share: float) -> float:
+            return recent[min(len(recent) - 1, int(share * len(recent)))] * 1000 if recent else 0.0
+
+        return {
+            'checkouts': self.checkouts,
+            'timeouts': self.timeouts,
+            'avg_wait_ms': self.total_wait / self.checkouts * 1000 if self.checkouts else 0.0,
+            'p50_wait_ms': percentile(0.50),
+            'p95_wait_ms': percentile(0.95),
+            'max_wait_ms': self.max_wait * 1000,
+        }
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waited (including connect), per engine"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def recreate(self) -> 'TimedQueuePool':
+        # engine.dispose() swaps in a new pool; keep counting where the old one stopped
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.stats.record(time.perf_counter() - started, timed_out=True)
+            raise
+        except Exception:
+            # Connect errors are not pool exhaustion
+            self.stats.record(time.perf_counter() - started)
+            raise
+        self.stats.record(time.perf_counter() - started)
+        return connection
+
+
+def create_async_db_engine(url: str) -> AsyncEngine:
+    """Create async engine with pool settings from config"""
+    return create_async_engine(
+        url,
+        echo=False,
+        poolclass=TimedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_pre_ping=True,
+        connect_args={
+            # asyncpg's own cache and SQLAlchemy's cache of prepared statements
+            'statement_cache_size': DB_STATEMENT_CACHE_SIZE,
+            'prepared_statement_cache_size': DB_STATEMENT_CACHE_SIZE,
+        },
+    )
+
 
 # Async engine for main application
-async_engine = create_async_engine(DATABASE_URL, echo=False)
+async_engine = create_async_db_engine(DATABASE_URL)
 AsyncSessionLocal = sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
 
-# Sync engine for migrations
-from sqlalchemy import create_engine
+# Optional read replica for read-only sessions
+replica_engine = create_async_db_engine(REPLICA_DATABASE_URL) if REPLICA_DATABASE_URL else None
+ReplicaSessionLocal = (
+    sessionmaker(replica_engine, class_=AsyncSession, expire_on_commit=False) if replica_engine else None
+)
+
+# Replay lag in seconds; zero when the replica has replayed everything it received,
+# so an idle primary does not make the replica look stale. NULL (unknown) when it
+# is behind but has not replayed any transaction since startup
+REPLICA_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+""")
+# An unreachable replica must not stall the handler waiting for it
+REPLICA_CHECK_TIMEOUT = 2.0
+
+
+class ReplicaMonitor:
+    """Cached replica lag check deciding whether read-only sessions may use the replica"""
+
+    def __init__(self, max_lag: float, check_interval: float):
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.lag: Optional[float] = None
+        self.checked_at = 0.0
+        self.usable = False
+
+    async def is_usable(self) -> bool:
+        """Replica is reachable and lags less than max_lag, rechecked every check_interval seconds"""
+        if time.monotonic() - self.checked_at < self.check_interval:
+            return self.usable
+        # Set first so concurrent callers reuse the previous verdict instead of piling up checks
+        self.checked_at = time.monotonic()
+
+        try:
+            self.lag = await asyncio.wait_for(self._fetch_lag(), REPLICA_CHECK_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"Replica lag check failed, reading from primary: {e!r}")
+            self.lag = None
+            self.usable = False
+            return False
+
+        usable = self.lag is not None and self.lag <= self.max_lag
+        if usable != self.usable:
+            logger.info(f"Replica lag: {self.lag}, reads go to {'replica' if usable else 'primary'}")
+        self.usable = usable
+        return usable
+
+    @staticmethod
+    async def _fetch_lag() -> Optional[float]:
+        async with replica_engine.connect() as conn:
+            lag = (await conn.execute(REPLICA_LAG_QUERY)).scalar()
+        return None if lag is None else float(lag)
+
+
+replica_monitor = ReplicaMonitor(REPLICA_MAX_LAG, REPLICA_LAG_CHECK_INTERVAL)
+
+
+def get_pool_stats(engine: AsyncEngine = async_engine) -> dict:
+    """Pool occupancy and checkout wait statistics of an engine"""
+    pool = engine.pool
+    return {
+        'size': pool.size(),
+        'checked_out': pool.checkedout(),
+        'overflow': pool.overflow(),
+        **pool.stats.snapshot(),
+    }
 
-sync_engine = create_engine(SYNC_DATABASE_URL, echo=False)
-SyncSessionLocal = sessionmaker(sync_engine, expire_on_commit=False)
 
 Base = declarative_base()
 
+# Relationships use lazy='raise': an implicit load would fail under AsyncSession
+# or cost a query per object, so handlers pass selectinload/joinedload options
+
 # Association table for many-to-many relationship
 user_group_association = Table(
     'user_group_association',
@@ -53,13 +212,16 @@ class User(Base):
     registered_at = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.timezone(TIMEZONE)))
 
     # Relationships
-    groups = relationship("Group", secondary=user_group_association, back_populates="members")
-    created_groups = relationship("Group", back_populates="creator")
-    as_santa = relationship('DrawResult', foreign_keys='DrawResult.santa_id', back_populates='santa')
-    as_receiver = relationship('DrawResult', foreign_keys='DrawResult.receiver_id', back_populates='receiver')
-    sent_messages = relationship('AnonymousMessage', foreign_keys='AnonymousMessage.sender_id', back_populates='sender')
+    groups = relationship("Group", secondary=user_group_association, back_populates="members", lazy='raise')
+    created_groups = relationship("Group", back_populates="creator", lazy='raise')
+    as_santa = relationship('DrawResult', foreign_keys='DrawResult.santa_id', back_populates='santa',
+                            lazy='raise')
+    as_receiver = relationship('DrawResult', foreign_keys='DrawResult.receiver_id', back_populates='receiver',
+                               lazy='raise')
+    sent_messages = relationship('AnonymousMessage', foreign_keys='AnonymousMessage.sender_id',
+                                 back_populates='sender', lazy='raise')
     received_messages = relationship('AnonymousMessage', foreign_keys='AnonymousMessage.receiver_id',
-                                     back_populates='receiver')
+                                     back_populates='receiver', lazy='raise')
 
 
 class Group(Base):
@@ -72,16 +234,18 @@ class Group(Base):
     is_active = Column(Boolean, default=True, nullable=False)
     is_public = Column(Boolean, default=False, nullable=False)
     max_participants = Column(Integer, default=100, nullable=False)
+    # Kept in step with user_group_association by add_group_member/remove_group_member
+    member_count = Column(Integer, default=0, nullable=False)
     registration_open = Column(Boolean, default=True, nullable=False)
     creator_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.timezone(TIMEZONE)))
 
     # Relationships
-    creator = relationship("User", back_populates="created_groups")
-    members = relationship("User", secondary=user_group_association, back_populates="groups")
-    events = relationship("Event", back_populates="group")
-    invites = relationship('InviteCode', back_populates='group')
-    anonymous_messages = relationship('AnonymousMessage', back_populates='group')
+    creator = relationship("User", back_populates="created_groups", lazy='raise')
+    members = relationship("User", secondary=user_group_association, back_populates="groups", lazy='raise')
+    events = relationship("Event", back_populates="group", lazy='raise')
+    invites = relationship('InviteCode', back_populates='group', lazy='raise')
+    anonymous_messages = relationship('AnonymousMessage', back_populates='group', lazy='raise')
 
 
 class Event(Base):
@@ -95,12 +259,22 @@ class Event(Base):
     status = Column(String(20), default='waiting', nullable=False)
     price_limit = Column(String(100), nullable=True)
     draw_method = Column(String(20), default='auto', nullable=False)
+    draw_seed = Column(BigInteger, nullable=True)
+    # Scheduled draw failed at this time and will not be retried automatically
+    draw_failed_at = Column(DateTime(timezone=True), nullable=True)
     created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.timezone(TIMEZONE)))
 
     # Relationships
-    group = relationship("Group", back_populates="events")
-    results = relationship('DrawResult', back_populates='event')
-    exclusion_rules = relationship('ExclusionRule', back_populates='event')
+    group = relationship("Group", back_populates="events", lazy='raise')
+    results = relationship('DrawResult', back_populates='event', lazy='raise')
+    exclusion_rules = relationship('ExclusionRule', back_populates='event', lazy='raise')
+
+    __table_args__ = (
+        Index('idx_events_group_created', 'group_id', 'created_at'),
+        # Partial: only the few open events per group, newest first, for get_active_event
+        Index('idx_events_group_open', 'group_id', text('created_at DESC'),
+              postgresql_where=text("status IN ('waiting', 'active')")),
+    )
 
 
 class DrawResult(Base):
@@ -119,9 +293,9 @@ class DrawResult(Base):
     created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.timezone(TIMEZONE)))
 
     # Relationships
-    event = relationship('Event', back_populates='results')
-    santa = relationship('User', foreign_keys=[santa_id], back_populates='as_santa')
-    receiver = relationship('User', foreign_keys=[receiver_id], back_populates='as_receiver')
+    event = relationship('Event', back_populates='results', lazy='raise')
+    santa = relationship('User', foreign_keys=[santa_id], back_populates='as_santa', lazy='raise')
+    receiver = relationship('User', foreign_keys=[receiver_id], back_populates='as_receiver', lazy='raise')
 
     __table_args__ = (
         UniqueConstraint('event_id', 'santa_id', name='unique_event_santa'),
@@ -130,6 +304,24 @@ class DrawResult(Base):
     )
 
 
+class DrawRepair(Base):
+    """Member spliced into or out of a held draw, replayed in id order"""
+    __tablename__ = 'draw_repairs'
+
+    id = Column(Integer, primary_key=True, index=True)
+    event_id = Column(Integer, ForeignKey('events.id', ondelete='CASCADE'), nullable=False)
+    operation = Column(String(10), nullable=False)
+    # No foreign key: the log outlives the user
+    user_id = Column(Integer, nullable=False)
+    seed = Column(BigInteger, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.timezone(TIMEZONE)))
+
+    __table_args__ = (
+        Index('idx_draw_repairs_event', 'event_id', 'id'),
+        CheckConstraint("operation IN ('add', 'remove')", name='valid_repair_operation'),
+    )
+
+
 class ExclusionRule(Base):
     __tablename__ = 'exclusion_rules'
 
@@ -142,9 +334,9 @@ class ExclusionRule(Base):
     created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.timezone(TIMEZONE)))
 
     # Relationships
-    event = relationship("Event", back_populates="exclusion_rules")
-    user1 = relationship("User", foreign_keys=[user1_id])
-    user2 = relationship("User", foreign_keys=[user2_id])
+    event = relationship("Event", back_populates="exclusion_rules", lazy='raise')
+    user1 = relationship("User", foreign_keys=[user1_id], lazy='raise')
+    user2 = relationship("User", foreign_keys=[user2_id], lazy='raise')
 
     __table_args__ = (
         UniqueConstraint('event_id', 'user1_id', 'user2_id', name='unique_exclusion'),
@@ -165,9 +357,9 @@ class AnonymousMessage(Base):
     created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.timezone(TIMEZONE)))
 
     # Relationships
-    sender = relationship('User', foreign_keys=[sender_id], back_populates='sent_messages')
-    receiver = relationship('User', foreign_keys=[receiver_id], back_populates='received_messages')
-    group = relationship("Group", back_populates="anonymous_messages")
+    sender = relationship('User', foreign_keys=[sender_id], back_populates='sent_messages', lazy='raise')
+    receiver = relationship('User', foreign_keys=[receiver_id], back_populates='received_messages', lazy='raise')
+    group = relationship("Group", back_populates="anonymous_messages", lazy='raise')
 
 
 class InviteCode(Base):
@@ -184,15 +376,23 @@ class InviteCode(Base):
     created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.timezone(TIMEZONE)))
 
     # Relationships
-    group = relationship("Group", back_populates="invites")
-    creator = relationship("User")
+    group = relationship("Group", back_populates="invites", lazy='raise')
+    creator = relationship("User", lazy='raise')
 
 
 # Context manager for async sessions
 @asynccontextmanager
-async def get_db_session():
-    """Async context manager for database sessions"""
-    async with AsyncSessionLocal() as session:
+async def get_db_session(read_only: bool = False):
+    """Async context manager for database sessions.
+
+    read_only sessions go to the replica when one is configured and not lagging
+    behind, otherwise to the primary. Use them only for handlers that never write.
+    """
+    session_factory = AsyncSessionLocal
+    if read_only and replica_engine is not None and await replica_monitor.is_usable():
+        session_factory = ReplicaSessionLocal
+
+    async with session_factory() as session:
         try:
             yield session
             await session.commit()
@@ -203,6 +403,11 @@ async def get_db_session():
             await session.close()
 
 
+def is_replica_session(session: AsyncSession) -> bool:
+    """Session reads from the replica, whose data may lag behind the primary"""
+    return replica_engine is not None and session.bind is replica_engine
+
+
 async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
     """Async database session generator"""
     async with AsyncSessionLocal() as session:
@@ -212,17 +417,85 @@ async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
             await session.close()
 
 
+INVITE_CODE_ATTEMPTS = 5
+
+
 def generate_invite_code(length=8) -> str:
-    """Generate unique invite code"""
+    """Generate random invite code, uniqueness is enforced by the unique index on insert"""
     alphabet = string.ascii_uppercase + string.digits
-    while True:
-        code = ''.join(secrets.choice(alphabet) for _ in range(length))
-        db = SyncSessionLocal()
-        existing = db.query(Group).filter(Group.invite_code == code).first()
-        db.close()
-        if not existing:
-            return code
+    return ''.join(secrets.choice(alphabet) for _ in range(length))
+
+
+async def add_group(session: AsyncSession, group: Group) -> Group:
+    """Insert group with a fresh invite code, retrying on the rare code collision"""
+    for _ in range(INVITE_CODE_ATTEMPTS):
+        group.invite_code = generate_invite_code()
+        try:
+            async with session.begin_nested():
+                session.add(group)
+                await session.flush()
+            return group
+        except IntegrityError as e:
+            if 'invite_code' not in str(e.orig):
+                raise
+    raise RuntimeError(f"Could not generate unique invite code in {INVITE_CODE_ATTEMPTS} attempts")
+
+
+# Statuses returned by redeem_invite()
+REDEEM_JOINED = 'joined'
+REDEEM_NOT_FOUND = 'not_found'
+REDEEM_CLOSED = 'closed'
+REDEEM_ALREADY_MEMBER = 'already_member'
+REDEEM_INVITE_EXPIRED = 'invite_expired'
+REDEEM_FULL = 'full'
+
+
+async def redeem_invite(session: AsyncSession, code: str, user_id: int) -> Tuple[str, Optional[int], Optional[int]]:
+    """Join group by invite code in one round-trip, returns (status, group id, member count).
+
+    Runs the redeem_invite() database function (migration 0005), which checks
+    registration, membership, invite expiry and usage and group capacity, then
+    adds the member and bumps both counters under the group row lock.
+    """
+    result = await session.execute(
+        text("SELECT status, joined_group_id, new_member_count FROM redeem_invite(:code, :user_id)"),
+        {'code': code, 'user_id': user_id}
+    )
+    return tuple(result.one())
+
 
+async def add_group_member(session: AsyncSession, group_id: int, user_id: int) -> Optional[int]:
+    """Add user to group if there is room, returns new member count or None if the group is full.
 
-# Create tables
-Base.metadata.create_all(bind=sync_engine)
\ No newline at end of file
+    The conditional increment locks the group row, so concurrent joins cannot
+    push the group past max_participants.
+    """
+    result = await session.execute(
+        update(Group)
+        .where(Group.id == group_id, Group.member_count < Group.max_participants)
+        .values(member_count=Group.member_count + 1)
+        .returning(Group.member_count)
+    )
+    member_count = result.scalar_one_or_none()
+    if member_count is None:
+        return None
+
+    await session.execute(user_group_association.insert().values(user_id=user_id, group_id=group_id))
+    return member_count
+
+
+async def remove_group_member(session: AsyncSession, group_id: int, user_id: int) -> bool:
+    """Remove user from group, False if they were not a member"""
+    result = await session.execute(
+        delete(user_group_association).where(
+            user_group_association.c.user_id == user_id,
+            user_group_association.c.group_id == group_id
+        )
+    )
+    if result.rowcount == 0:
+        return False
+
+    await session.execute(
+        update(Group).where(Group.id == group_id).values(member_count=Group.member_count - 1)
+    )
+    return True
@@ -0,0 +1,142 @@
+-- Schema as first created by SQLAlchemy create_all
+
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL NOT NULL,
+    telegram_id BIGINT NOT NULL,
+    username VARCHAR(64),
+    full_name VARCHAR(200) NOT NULL,
+    wishlist TEXT NOT NULL,
+    contact_info TEXT,
+    is_admin BOOLEAN NOT NULL,
+    is_global_admin BOOLEAN NOT NULL,
+    is_banned BOOLEAN NOT NULL,
+    spam_score INTEGER NOT NULL,
+    last_activity TIMESTAMP WITH TIME ZONE,
+    registered_at TIMESTAMP WITH TIME ZONE,
+    PRIMARY KEY (id)
+);
+
+CREATE INDEX IF NOT EXISTS ix_users_id ON users (id);
+CREATE UNIQUE INDEX IF NOT EXISTS ix_users_telegram_id ON users (telegram_id);
+
+CREATE TABLE IF NOT EXISTS groups (
+    id SERIAL NOT NULL,
+    name VARCHAR(100) NOT NULL,
+    description TEXT,
+    invite_code VARCHAR(10) NOT NULL,
+    is_active BOOLEAN NOT NULL,
+    is_public BOOLEAN NOT NULL,
+    max_participants INTEGER NOT NULL,
+    registration_open BOOLEAN NOT NULL,
+    creator_id INTEGER NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE,
+    PRIMARY KEY (id),
+    FOREIGN KEY(creator_id) REFERENCES users (id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS ix_groups_id ON groups (id);
+CREATE UNIQUE INDEX IF NOT EXISTS ix_groups_invite_code ON groups (invite_code);
+
+CREATE TABLE IF NOT EXISTS anonymous_messages (
+    id SERIAL NOT NULL,
+    sender_id INTEGER NOT NULL,
+    receiver_id INTEGER NOT NULL,
+    group_id INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    is_read BOOLEAN NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE,
+    PRIMARY KEY (id),
+    FOREIGN KEY(sender_id) REFERENCES users (id) ON DELETE CASCADE,
+    FOREIGN KEY(receiver_id) REFERENCES users (id) ON DELETE CASCADE,
+    FOREIGN KEY(group_id) REFERENCES groups (id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS ix_anonymous_messages_id ON anonymous_messages (id);
+
+CREATE TABLE IF NOT EXISTS events (
+    id SERIAL NOT NULL,
+    name VARCHAR(100) NOT NULL,
+    group_id INTEGER NOT NULL,
+    start_date TIMESTAMP WITH TIME ZONE,
+    end_date TIMESTAMP WITH TIME ZONE,
+    status VARCHAR(20) NOT NULL,
+    price_limit VARCHAR(100),
+    draw_method VARCHAR(20) NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE,
+    PRIMARY KEY (id),
+    FOREIGN KEY(group_id) REFERENCES groups (id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS ix_events_id ON events (id);
+
+CREATE TABLE IF NOT EXISTS invite_codes (
+    id SERIAL NOT NULL,
+    code VARCHAR(10) NOT NULL,
+    group_id INTEGER NOT NULL,
+    created_by INTEGER NOT NULL,
+    max_uses INTEGER NOT NULL,
+    used_count INTEGER NOT NULL,
+    expires_at TIMESTAMP WITH TIME ZONE,
+    is_active BOOLEAN NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE,
+    PRIMARY KEY (id),
+    FOREIGN KEY(group_id) REFERENCES groups (id) ON DELETE CASCADE,
+    FOREIGN KEY(created_by) REFERENCES users (id) ON DELETE CASCADE
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS ix_invite_codes_code ON invite_codes (code);
+CREATE INDEX IF NOT EXISTS ix_invite_codes_id ON invite_codes (id);
+
+CREATE TABLE IF NOT EXISTS user_group_association (
+    user_id INTEGER NOT NULL,
+    group_id INTEGER NOT NULL,
+    joined_at TIMESTAMP WITH TIME ZONE,
+    PRIMARY KEY (user_id, group_id),
+    FOREIGN KEY(user_id) REFERENCES users (id) ON DELETE CASCADE,
+    FOREIGN KEY(group_id) REFERENCES groups (id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_user_group_group ON user_group_association (group_id);
+CREATE INDEX IF NOT EXISTS idx_user_group_user ON user_group_association (user_id);
+
+CREATE TABLE IF NOT EXISTS draw_results (
+    id SERIAL NOT NULL,
+    event_id INTEGER NOT NULL,
+    santa_id INTEGER NOT NULL,
+    receiver_id INTEGER NOT NULL,
+    gift_sent BOOLEAN NOT NULL,
+    gift_delivered BOOLEAN NOT NULL,
+    gift_confirmed BOOLEAN NOT NULL,
+    notified BOOLEAN NOT NULL,
+    manual_assignment BOOLEAN NOT NULL,
+    notes TEXT,
+    created_at TIMESTAMP WITH TIME ZONE,
+    PRIMARY KEY (id),
+    CONSTRAINT unique_event_santa UNIQUE (event_id, santa_id),
+    CONSTRAINT unique_event_receiver UNIQUE (event_id, receiver_id),
+    CONSTRAINT no_self_gift CHECK (santa_id != receiver_id),
+    FOREIGN KEY(event_id) REFERENCES events (id) ON DELETE CASCADE,
+    FOREIGN KEY(santa_id) REFERENCES users (id) ON DELETE CASCADE,
+    FOREIGN KEY(receiver_id) REFERENCES users (id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS ix_draw_results_id ON draw_results (id);
+
+CREATE TABLE IF NOT EXISTS exclusion_rules (
+    id SERIAL NOT NULL,
+    event_id INTEGER NOT NULL,
+    user1_id INTEGER NOT NULL,
+    user2_id INTEGER NOT NULL,
+    rule_type VARCHAR(20) NOT NULL,
+    reason TEXT,
+    created_at TIMESTAMP WITH TIME ZONE,
+    PRIMARY KEY (id),
+    CONSTRAINT unique_exclusion UNIQUE (event_id, user1_id, user2_id),
+    CONSTRAINT valid_rule_type CHECK (rule_type IN ('mutual', 'directional')),
+    CONSTRAINT different_users CHECK (user1_id != user2_id),
+    FOREIGN KEY(event_id) REFERENCES events (id) ON DELETE CASCADE,
+    FOREIGN KEY(user1_id) REFERENCES users (id) ON DELETE CASCADE,
+    FOREIGN KEY(user2_id) REFERENCES users (id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS ix_exclusion_rules_id ON exclusion_rules (id);
@@ -0,0 +1,2 @@
+-- Seed of the event's draw, to replay it for audits
+ALTER TABLE events ADD COLUMN IF NOT EXISTS draw_seed BIGINT;
@@ -0,0 +1,2 @@
+-- Previous events of a group, newest first, for history-aware draws
+CREATE INDEX IF NOT EXISTS idx_events_group_created ON events (group_id, created_at);
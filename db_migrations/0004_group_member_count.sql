@@ -0,0 +1,10 @@
+-- Denormalized member count, maintained by add_group_member/remove_group_member
+ALTER TABLE groups ADD COLUMN IF NOT EXISTS member_count INTEGER NOT NULL DEFAULT 0;
+
+UPDATE groups SET member_count = counts.member_count
+FROM (
+    SELECT group_id, count(*) AS member_count
+    FROM user_group_association
+    GROUP BY group_id
+) AS counts
+WHERE groups.id = counts.group_id;
@@ -0,0 +1,71 @@
+-- Redeem an invite code in one call: validates the group and the invite,
+-- adds the member and bumps member_count and used_count together.
+-- Locking the group row first serializes concurrent redemptions for a group,
+-- so neither max_participants nor max_uses can be exceeded.
+CREATE OR REPLACE FUNCTION redeem_invite(p_code TEXT, p_user_id INTEGER)
+RETURNS TABLE (status TEXT, joined_group_id INTEGER, new_member_count INTEGER)
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_group_id INTEGER;
+    v_registration_open BOOLEAN;
+    v_member_count INTEGER;
+    v_max_participants INTEGER;
+    v_invite_id INTEGER;
+    v_invite_usable BOOLEAN;
+BEGIN
+    SELECT g.id, g.registration_open, g.member_count, g.max_participants
+    INTO v_group_id, v_registration_open, v_member_count, v_max_participants
+    FROM groups g
+    WHERE g.invite_code = p_code
+    FOR UPDATE;
+
+    IF v_group_id IS NULL THEN
+        RETURN QUERY SELECT 'not_found'::TEXT, NULL::INTEGER, NULL::INTEGER;
+        RETURN;
+    END IF;
+
+    IF NOT v_registration_open THEN
+        RETURN QUERY SELECT 'closed'::TEXT, v_group_id, v_member_count;
+        RETURN;
+    END IF;
+
+    IF EXISTS (
+        SELECT 1 FROM user_group_association uga
+        WHERE uga.group_id = v_group_id AND uga.user_id = p_user_id
+    ) THEN
+        RETURN QUERY SELECT 'already_member'::TEXT, v_group_id, v_member_count;
+        RETURN;
+    END IF;
+
+    -- Groups created before invite_codes existed have no invite row
+    SELECT i.id, i.is_active AND i.used_count < i.max_uses AND (i.expires_at IS NULL OR i.expires_at > now())
+    INTO v_invite_id, v_invite_usable
+    FROM invite_codes i
+    WHERE i.code = p_code
+    FOR UPDATE;
+
+    IF v_invite_id IS NOT NULL AND NOT v_invite_usable THEN
+        RETURN QUERY SELECT 'invite_expired'::TEXT, v_group_id, v_member_count;
+        RETURN;
+    END IF;
+
+    IF v_member_count >= v_max_participants THEN
+        RETURN QUERY SELECT 'full'::TEXT, v_group_id, v_member_count;
+        RETURN;
+    END IF;
+
+    INSERT INTO user_group_association (user_id, group_id, joined_at)
+    VALUES (p_user_id, v_group_id, now());
+
+    UPDATE groups g SET member_count = g.member_count + 1 WHERE g.id = v_group_id;
+
+    IF v_invite_id IS NOT NULL THEN
+        UPDATE invite_codes i
+        SET used_count = i.used_count + 1,
+            is_active = i.used_count + 1 < i.max_uses
+        WHERE i.id = v_invite_id;
+    END IF;
+
+    RETURN QUERY SELECT 'joined'::TEXT, v_group_id, v_member_count + 1;
+END;
+$$;
@@ -0,0 +1,3 @@
+-- Open events of a group, newest first: get_active_event becomes a one-row index probe
+CREATE INDEX IF NOT EXISTS idx_events_group_open ON events (group_id, created_at DESC)
+    WHERE status IN ('waiting', 'active');
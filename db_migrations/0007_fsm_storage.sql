@@ -0,0 +1,9 @@
+-- aiogram FSM states, written in batches by fsm_storage.PostgresStorage.
+-- UNLOGGED: no WAL per transition; an unclean shutdown empties the table,
+-- which only drops half-finished dialogs.
+CREATE UNLOGGED TABLE IF NOT EXISTS fsm_storage (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data JSONB NOT NULL DEFAULT '{}',
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+);
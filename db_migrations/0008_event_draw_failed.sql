@@ -0,0 +1,2 @@
+-- Set when a scheduled draw failed: the scheduler skips the event until it is drawn by hand
+ALTER TABLE events ADD COLUMN IF NOT EXISTS draw_failed_at TIMESTAMP WITH TIME ZONE;
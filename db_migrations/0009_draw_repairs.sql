@@ -0,0 +1,12 @@
+-- Members spliced into or out of a held draw, in order, so replay_draw can redo them
+CREATE TABLE IF NOT EXISTS draw_repairs (
+    id SERIAL PRIMARY KEY,
+    event_id INTEGER NOT NULL REFERENCES events(id) ON DELETE CASCADE,
+    operation VARCHAR(10) NOT NULL,
+    user_id INTEGER NOT NULL,
+    seed BIGINT NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+    CONSTRAINT valid_repair_operation CHECK (operation IN ('add', 'remove'))
+);
+
+CREATE INDEX IF NOT EXISTS idx_draw_repairs_event ON draw_repairs (event_id, id);
@@ -0,0 +1,627 @@
+"""
+Secret Santa draw engine.
+
+Pure assignment algorithms with no database or bot dependencies, so they can
+be reused from handlers, scheduled jobs and scripts alike.
+An assignment maps santa user id -> receiver user id.
+"""
+import random
+import secrets
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+MIN_DRAW_PARTICIPANTS = 3
+
+# Event.draw_method values
+DRAW_METHOD_AUTO = 'auto'
+DRAW_METHOD_CYCLE = 'cycle'
+DRAW_METHODS = (DRAW_METHOD_AUTO, DRAW_METHOD_CYCLE)
+
+# DrawRepair.operation values
+DRAW_REPAIR_ADD = 'add'
+DRAW_REPAIR_REMOVE = 'remove'
+
+# Budget of the randomized Hamiltonian cycle search before falling back to matching
+CYCLE_SHUFFLE_ATTEMPTS = 20
+CYCLE_SEARCH_STEPS = 20000
+
+# Events this large, in either mode, skip the O(n^2) matching graph and use random cycles with repair
+LARGE_DRAW_THRESHOLD = 500
+REPAIR_TRIES = 200
+
+# How many previous events of the group are remembered; a pair repeated from
+# `age` events ago costs HISTORY_DEPTH - age, so last year weighs the most
+HISTORY_DEPTH = 3
+NO_EDGE_COST = 10 ** 9
+
+# (user1_id, user2_id, rule_type) as stored in ExclusionRule
+Rule = Tuple[int, int, str]
+Assignment = Dict[int, int]
+# (santa_id, receiver_id, age) from previous events of the group, age 0 is the last one
+HistoryPair = Tuple[int, int, int]
+
+
+class DrawError(Exception):
+    """Base class for draw failures"""
+
+
+class NotEnoughParticipantsError(DrawError):
+    """Group is too small for a draw"""
+
+
+class DrawInfeasibleError(DrawError):
+    """Exclusion rules leave no valid assignment"""
+
+    def __init__(self, message: str, blocking: Optional[List[int]] = None):
+        super().__init__(message)
+        # Santas that together have fewer allowed receivers than their own number
+        self.blocking = blocking or []
+
+
+@dataclass
+class Feasibility:
+    """Result of a draw feasibility check"""
+    feasible: bool
+    matched: int
+    total: int
+    # Hall violator: santas whose allowed receivers are fewer than themselves
+    blocking: List[int] = field(default_factory=list)
+    receivers: List[int] = field(default_factory=list)
+
+
+def build_forbidden(member_ids: Iterable[int], rules: Iterable[Rule]) -> Dict[int, Set[int]]:
+    """Turn exclusion rules into forbidden santa -> receiver edges"""
+    members = set(member_ids)
+    forbidden = {user_id: set() for user_id in members}
+    for user1_id, user2_id, rule_type in rules:
+        if user1_id not in members or user2_id not in members:
+            continue
+        forbidden[user1_id].add(user2_id)
+        if rule_type == 'mutual':
+            forbidden[user2_id].add(user1_id)
+    return forbidden
+
+
+def _build_adjacency(members: List[int], forbidden: Dict[int, Set[int]],
+                     rng: Optional[random.Random] = None) -> List[List[int]]:
+    """Allowed receiver indexes for every santa index, in random order if rng is given"""
+    adj = []
+    for i, santa_id in enumerate(members):
+        blocked = forbidden.get(santa_id, ())
+        edges = [j for j, receiver_id in enumerate(members) if j != i and receiver_id not in blocked]
+        if rng is not None:
+            rng.shuffle(edges)
+        adj.append(edges)
+    return adj
+
+
+def _bfs_layers(adj: List[List[int]], match_l: List[int], match_r: List[int], dist: List[int]) -> bool:
+    """Build BFS layers from free santas; True if a free receiver is reachable"""
+    queue = deque()
+    for u in range(len(adj)):
+        if match_l[u] == -1:
+            dist[u] = 0
+            queue.append(u)
+        else:
+            dist[u] = -1
+
+    found = False
+    while queue:
+        u = queue.popleft()
+        for v in adj[u]:
+            w = match_r[v]
+            if w == -1:
+                found = True
+            elif dist[w] == -1:
+                dist[w] = dist[u] + 1
+                queue.append(w)
+    return found
+
+
+def _augment(root: int, adj: List[List[int]], match_l: List[int], match_r: List[int],
+             dist: List[int], ptr: List[int]) -> bool:
+    """Iterative layered DFS looking for an augmenting path from root"""
+    stack = [root]
+    via = []
+    while stack:
+        u = stack[-1]
+        edges = adj[u]
+        pushed = False
+        while ptr[u] < len(edges):
+            v = edges[ptr[u]]
+            ptr[u] += 1
+            w = match_r[v]
+            if w == -1:
+                via.append(v)
+                for santa, receiver in zip(stack, via):
+                    match_l[santa] = receiver
+                    match_r[receiver] = santa
+                return True
+            if dist[w] == dist[u] + 1:
+                via.append(v)
+                stack.append(w)
+                pushed = True
+                break
+        if not pushed:
+            # Dead end for this phase
+            dist[u] = -1
+            stack.pop()
+            if via:
+                via.pop()
+    return False
+
+
+def hopcroft_karp(adj: List[List[int]], n_right: int,
+                  rng: Optional[random.Random] = None) -> Tuple[List[int], List[int]]:
+    """Maximum bipartite matching, returns (match_left, match_right) with -1 for free vertices"""
+    n_left = len(adj)
+    match_l = [-1] * n_left
+    match_r = [-1] * n_right
+    dist = [-1] * n_left
+    order = list(range(n_left))
+    if rng is not None:
+        rng.shuffle(order)
+
+    while _bfs_layers(adj, match_l, match_r, dist):
+        ptr = [0] * n_left
+        for u in order:
+            if match_l[u] == -1:
+                _augment(u, adj, match_l, match_r, dist, ptr)
+    return match_l, match_r
+
+
+def _hall_violator(root: int, adj: List[List[int]], match_r: List[int]) -> Tuple[List[int], List[int]]:
+    """Santas and receivers reachable by alternating paths from an unmatched santa.
+
+    With a maximum matching every reached receiver is matched, so the reached
+    santas have exactly one allowed receiver fewer than their own number.
+    """
+    santas = {root}
+    receivers = set()
+    queue = deque([root])
+    while queue:
+        u = queue.popleft()
+        for v in adj[u]:
+            if v in receivers:
+                continue
+            receivers.add(v)
+            w = match_r[v]
+            if w != -1 and w not in santas:
+                santas.add(w)
+                queue.append(w)
+    return sorted(santas), sorted(receivers)
+
+
+def check_feasibility(member_ids: Iterable[int], forbidden: Dict[int, Set[int]]) -> Feasibility:
+    """Check if a draw is possible, reporting the smallest blocking set found otherwise.
+
+    Groups below MIN_DRAW_PARTICIPANTS are never feasible; they have no blocking set.
+    """
+    members = list(member_ids)
+    adj = _build_adjacency(members, forbidden)
+    match_l, match_r = hopcroft_karp(adj, len(members))
+    unmatched = [u for u, v in enumerate(match_l) if v == -1]
+    report = Feasibility(
+        feasible=not unmatched and len(members) >= MIN_DRAW_PARTICIPANTS,
+        matched=len(members) - len(unmatched),
+        total=len(members)
+    )
+    if unmatched:
+        santas, receivers = min(
+            (_hall_violator(u, adj, match_r) for u in unmatched),
+            key=lambda violator: len(violator[0])
+        )
+        report.blocking = [members[i] for i in santas]
+        report.receivers = [members[j] for j in receivers]
+    return report
+
+
+def match_assignment(member_ids: Iterable[int], forbidden: Dict[int, Set[int]],
+                     rng: Optional[random.Random] = None) -> Assignment:
+    """Draw as a bipartite perfect matching santas -> receivers"""
+    rng = rng or random.Random()
+    members = list(member_ids)
+    if len(members) < MIN_DRAW_PARTICIPANTS:
+        raise NotEnoughParticipantsError(f"need at least {MIN_DRAW_PARTICIPANTS} participants")
+
+    adj = _build_adjacency(members, forbidden, rng)
+    match_l, match_r = hopcroft_karp(adj, len(members), rng)
+    if -1 in match_l:
+        santas, _ = _hall_violator(match_l.index(-1), adj, match_r)
+        raise DrawInfeasibleError(
+            "exclusion rules leave no perfect matching",
+            blocking=[members[i] for i in santas]
+        )
+    return {members[i]: members[j] for i, j in enumerate(match_l)}
+
+
+def build_penalties(member_ids: Iterable[int], history: Iterable[HistoryPair]) -> Dict[int, Dict[int, int]]:
+    """Turn past pairs into santa -> {receiver: cost} soft penalties"""
+    members = set(member_ids)
+    penalties = {}
+    for santa_id, receiver_id, age in history:
+        if santa_id in members and receiver_id in members and age < HISTORY_DEPTH:
+            row = penalties.setdefault(santa_id, {})
+            row[receiver_id] = row.get(receiver_id, 0) + HISTORY_DEPTH - age
+    return penalties
+
+
+def _with_penalties(forbidden: Dict[int, Set[int]], penalties: Dict[int, Dict[int, int]]) -> Dict[int, Set[int]]:
+    """Forbidden edges with every penalized pair forbidden as well"""
+    return {
+        santa_id: blocked | penalties.get(santa_id, {}).keys()
+        for santa_id, blocked in forbidden.items()
+    }
+
+
+def _hungarian(cost: List[List[int]], match_l: List[int], match_r: List[int]):
+    """Complete a matching of zero-cost edges into a min-cost perfect matching, in place.
+
+    Hungarian algorithm with potentials. Zero potentials plus a matching of
+    zero-cost edges is already a valid state, so only the rows left unmatched
+    need a phase, O(n^2) each.
+    """
+    n = len(cost)
+    inf = float('inf')
+    u = [0] * (n + 1)
+    v = [0] * (n + 1)
+    # 1-based: p[j] is the row matched to column j, p[0] the row being added
+    p = [0] * (n + 1)
+    way = [0] * (n + 1)
+    for i, j in enumerate(match_l):
+        if j != -1:
+            p[j + 1] = i + 1
+
+    for i in range(n):
+        if match_l[i] != -1:
+            continue
+        p[0] = i + 1
+        j0 = 0
+        minv = [inf] * (n + 1)
+        used = [False] * (n + 1)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            row = cost[i0 - 1]
+            u_i0 = u[i0]
+            delta = inf
+            j1 = 0
+            for j in range(1, n + 1):
+                if not used[j]:
+                    cur = row[j - 1] - u_i0 - v[j]
+                    if cur < minv[j]:
+                        minv[j] = cur
+                        way[j] = j0
+                    if minv[j] < delta:
+                        delta = minv[j]
+                        j1 = j
+            for j in range(n + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    for j in range(1, n + 1):
+        match_l[p[j] - 1] = j - 1
+        match_r[j - 1] = p[j] - 1
+
+
+def min_cost_assignment(member_ids: Iterable[int], forbidden: Dict[int, Set[int]],
+                        penalties: Dict[int, Dict[int, int]],
+                        rng: Optional[random.Random] = None) -> Assignment:
+    """Draw with the least total penalty for repeated pairs, exclusions stay hard"""
+    rng = rng or random.Random()
+    members = list(member_ids)
+    n = len(members)
+    if n < MIN_DRAW_PARTICIPANTS:
+        raise NotEnoughParticipantsError(f"need at least {MIN_DRAW_PARTICIPANTS} participants")
+
+    # Random order, so equally good assignments are picked at random
+    rng.shuffle(members)
+
+    # Usually every past pair can simply be avoided
+    adj = _build_adjacency(members, _with_penalties(forbidden, penalties), rng)
+    match_l, match_r = hopcroft_karp(adj, n, rng)
+    if -1 in match_l:
+        cost = [
+            [
+                NO_EDGE_COST if i == j or receiver_id in forbidden.get(santa_id, ())
+                else penalties.get(santa_id, {}).get(receiver_id, 0)
+                for j, receiver_id in enumerate(members)
+            ]
+            for i, santa_id in enumerate(members)
+        ]
+        _hungarian(cost, match_l, match_r)
+        if any(cost[i][j] >= NO_EDGE_COST for i, j in enumerate(match_l)):
+            raise DrawInfeasibleError(
+                "exclusion rules leave no perfect matching",
+                blocking=check_feasibility(members, forbidden).blocking
+            )
+    return {members[i]: members[j] for i, j in enumerate(match_l)}
+
+
+def _cycle_to_assignment(cycle: List[int]) -> Assignment:
+    """Link consecutive members of a cycle, last one gives to the first"""
+    return {santa_id: cycle[(i + 1) % len(cycle)] for i, santa_id in enumerate(cycle)}
+
+
+def _is_valid_cycle(cycle: List[int], forbidden: Dict[int, Set[int]]) -> bool:
+    """Check that no link of the cycle is forbidden"""
+    return all(
+        receiver_id not in forbidden.get(santa_id, ())
+        for santa_id, receiver_id in _cycle_to_assignment(cycle).items()
+    )
+
+
+def _hamiltonian_cycle(adj: List[List[int]], max_steps: int) -> Optional[List[int]]:
+    """Randomized DFS for a Hamiltonian cycle over index adjacency, None when budget is spent"""
+    n = len(adj)
+    start = 0
+    can_close = [start in edges for edges in adj]
+    visited = [False] * n
+    visited[start] = True
+    path = [start]
+    frames = [iter(adj[start])]
+    steps = 0
+
+    while frames:
+        if len(path) == n:
+            if can_close[path[-1]]:
+                return path
+            visited[path.pop()] = False
+            frames.pop()
+            continue
+
+        steps += 1
+        if steps > max_steps:
+            return None
+
+        nxt = next((v for v in frames[-1] if not visited[v]), None)
+        if nxt is None:
+            visited[path.pop()] = False
+            frames.pop()
+            continue
+
+        visited[nxt] = True
+        path.append(nxt)
+        frames.append(iter(adj[nxt]))
+    return None
+
+
+def _find_cycle(members: List[int], forbidden: Dict[int, Set[int]],
+                rng: random.Random) -> Optional[Assignment]:
+    """One chain over all members, None if the bounded search finds none"""
+    # A random permutation read as a cycle is uniform over all single cycles
+    cycle = members[:]
+    rng.shuffle(cycle)
+    if not any(forbidden.get(user_id) for user_id in members):
+        return _cycle_to_assignment(cycle)
+
+    for _ in range(CYCLE_SHUFFLE_ATTEMPTS):
+        if _is_valid_cycle(cycle, forbidden):
+            return _cycle_to_assignment(cycle)
+        rng.shuffle(cycle)
+
+    adj = _build_adjacency(cycle, forbidden, rng)
+    path = _hamiltonian_cycle(adj, CYCLE_SEARCH_STEPS)
+    if path is not None:
+        return _cycle_to_assignment([cycle[i] for i in path])
+    return None
+
+
+def cycle_assignment(member_ids: Iterable[int], forbidden: Dict[int, Set[int]],
+                     rng: Optional[random.Random] = None) -> Assignment:
+    """Draw as one chain A -> B -> ... -> A, falls back to matching if no cycle is found"""
+    rng = rng or random.Random()
+    members = list(member_ids)
+    if len(members) < MIN_DRAW_PARTICIPANTS:
+        raise NotEnoughParticipantsError(f"need at least {MIN_DRAW_PARTICIPANTS} participants")
+
+    return _find_cycle(members, forbidden, rng) or match_assignment(members, forbidden, rng)
+
+
+def _repair_assignment(assignment: Assignment, members: List[int], forbidden: Dict[int, Set[int]],
+                       rng: random.Random, suspects: Optional[Iterable[int]] = None) -> bool:
+    """Fix forbidden links by swapping receivers with random other santas"""
+    for santa_id in members if suspects is None else suspects:
+        blocked = forbidden.get(santa_id, ())
+        if assignment[santa_id] not in blocked:
+            continue
+        for _ in range(REPAIR_TRIES):
+            other_id = rng.choice(members)
+            receiver_id, other_receiver_id = assignment[santa_id], assignment[other_id]
+            if (other_id != santa_id and other_receiver_id != santa_id and other_receiver_id not in blocked
+                    and receiver_id != other_id and receiver_id not in forbidden.get(other_id, ())):
+                assignment[santa_id], assignment[other_id] = other_receiver_id, receiver_id
+                break
+        else:
+            return False
+    return True
+
+
+def random_cycle_assignment(member_ids: Iterable[int], forbidden: Dict[int, Set[int]],
+                            rng: Optional[random.Random] = None) -> Assignment:
+    """Draw for very large events: one random cycle with its forbidden links repaired"""
+    rng = rng or random.Random()
+    members = list(member_ids)
+    if len(members) < MIN_DRAW_PARTICIPANTS:
+        raise NotEnoughParticipantsError(f"need at least {MIN_DRAW_PARTICIPANTS} participants")
+
+    cycle = members[:]
+    rng.shuffle(cycle)
+    assignment = _cycle_to_assignment(cycle)
+    # Only santas with rules can hold a forbidden link
+    suspects = [santa_id for santa_id in members if forbidden.get(santa_id)]
+    if _repair_assignment(assignment, members, forbidden, rng, suspects):
+        return assignment
+    return match_assignment(members, forbidden, rng)
+
+
+def _relocate_repair(cycle: List[int], forbidden: Dict[int, Set[int]],
+                     rng: random.Random) -> Optional[Assignment]:
+    """Fix forbidden links of a cycle by moving receivers to other places in it.
+
+    S -> X -> N with S -> X forbidden becomes S -> N and Y -> X -> Z for a
+    random link Y -> Z. Every move keeps a single chain and adds only checked
+    links, so it costs O(n + rules) overall. None if some link stays forbidden.
+    """
+    succ = _cycle_to_assignment(cycle)
+    for santa_id in sorted(santa_id for santa_id in cycle if forbidden.get(santa_id)):
+        blocked = forbidden[santa_id]
+        tries = 0
+        while succ[santa_id] in blocked:
+            tries += 1
+            if tries > REPAIR_TRIES:
+                return None
+            moved_id = succ[santa_id]
+            next_id = succ[moved_id]
+            before_id = rng.choice(cycle)
+            after_id = succ[before_id]
+            if (before_id in (santa_id, moved_id) or next_id in blocked
+                    or moved_id in forbidden.get(before_id, ()) or after_id in forbidden.get(moved_id, ())):
+                continue
+            succ[santa_id] = next_id
+            succ[before_id] = moved_id
+            succ[moved_id] = after_id
+    return succ
+
+
+def large_cycle_assignment(member_ids: Iterable[int], forbidden: Dict[int, Set[int]],
+                           rng: Optional[random.Random] = None) -> Assignment:
+    """Single-chain draw for very large events without the O(n^2) graph.
+
+    Falls back to random_cycle_assignment, which may split the chain, if the
+    forbidden links cannot be moved away.
+    """
+    rng = rng or random.Random()
+    members = list(member_ids)
+    if len(members) < MIN_DRAW_PARTICIPANTS:
+        raise NotEnoughParticipantsError(f"need at least {MIN_DRAW_PARTICIPANTS} participants")
+
+    cycle = members[:]
+    for _ in range(CYCLE_SHUFFLE_ATTEMPTS):
+        rng.shuffle(cycle)
+        assignment = _relocate_repair(cycle, forbidden, rng)
+        if assignment is not None:
+            return assignment
+    return random_cycle_assignment(members, forbidden, rng)
+
+
+def splice_in(assignment: Assignment, user_id: int, forbidden: Dict[int, Set[int]],
+              rng: Optional[random.Random] = None) -> Assignment:
+    """Insert a new member into an existing draw: some S -> R becomes S -> user -> R.
+
+    Returns only the changed links {santa_id: new receiver_id}, including the new member's.
+    """
+    rng = rng or random.Random()
+    blocked = forbidden.get(user_id, ())
+    santas = sorted(assignment)
+    rng.shuffle(santas)
+    for santa_id in santas:
+        receiver_id = assignment[santa_id]
+        if user_id not in forbidden.get(santa_id, ()) and receiver_id not in blocked:
+            return {santa_id: user_id, user_id: receiver_id}
+    raise DrawInfeasibleError(f"no place for user {user_id} in the draw", blocking=[user_id])
+
+
+def splice_out(assignment: Assignment, user_id: int, forbidden: Dict[int, Set[int]],
+               rng: Optional[random.Random] = None, allow_swap: bool = True) -> Assignment:
+    """Remove a member from an existing draw, reconnecting their santa.
+
+    Returns only the changed links {santa_id: new receiver_id}; the member's own
+    link is to be deleted. Usually S -> user -> R becomes S -> R; when that is a
+    self-gift or forbidden, S takes the receiver B of another santa A and A gets R.
+    That swap splits the chain in two, so allow_swap=False raises instead.
+    """
+    rng = rng or random.Random()
+    receiver_id = assignment[user_id]
+    santa_id = next(s for s, r in assignment.items() if r == user_id)
+    if santa_id == user_id:
+        return {}
+
+    blocked = forbidden.get(santa_id, ())
+    if santa_id != receiver_id and receiver_id not in blocked:
+        return {santa_id: receiver_id}
+    if not allow_swap:
+        raise DrawInfeasibleError(f"cannot close the chain after user {user_id} left", blocking=[santa_id])
+
+    others = [s for s in sorted(assignment) if s not in (santa_id, user_id)]
+    rng.shuffle(others)
+    for other_id in others:
+        other_receiver_id = assignment[other_id]
+        if (other_receiver_id != santa_id and other_receiver_id not in blocked
+                and receiver_id != other_id and receiver_id not in forbidden.get(other_id, ())):
+            return {santa_id: other_receiver_id, other_id: receiver_id}
+    raise DrawInfeasibleError(f"cannot reconnect santa {santa_id} after user {user_id} left", blocking=[santa_id])
+
+
+def new_draw_seed() -> int:
+    """Random seed for a draw, fits Event.draw_seed (BIGINT)"""
+    return secrets.randbits(63)
+
+
+def compute_assignment(member_ids: Iterable[int], rules: Iterable[Rule],
+                       method: str = DRAW_METHOD_AUTO,
+                       seed: Optional[int] = None,
+                       history: Iterable[HistoryPair] = ()) -> Assignment:
+    """Compute santa -> receiver assignment for members under exclusion rules.
+
+    Pairs from previous events are avoided where possible; very large events
+    ignore history. The same arguments always give the same assignment.
+    """
+    rng = random.Random(seed)
+    members = sorted(set(member_ids))
+    forbidden = build_forbidden(members, rules)
+    penalties = build_penalties(members, history)
+    if method == DRAW_METHOD_CYCLE and len(members) >= LARGE_DRAW_THRESHOLD:
+        return large_cycle_assignment(members, forbidden, rng)
+    if method == DRAW_METHOD_CYCLE:
+        if penalties and len(members) >= MIN_DRAW_PARTICIPANTS:
+            fresh = _find_cycle(members, _with_penalties(forbidden, penalties), rng)
+            if fresh:
+                return fresh
+        return cycle_assignment(members, forbidden, rng)
+    if len(members) >= LARGE_DRAW_THRESHOLD:
+        return random_cycle_assignment(members, forbidden, rng)
+    if penalties:
+        return min_cost_assignment(members, forbidden, penalties, rng)
+    return match_assignment(members, forbidden, rng)
+
+
+def repair_draw(assignment: Assignment, operation: str, user_id: int, rules: Iterable[Rule],
+                method: str = DRAW_METHOD_AUTO,
+                seed: Optional[int] = None,
+                history: Iterable[HistoryPair] = ()) -> Assignment:
+    """Whole assignment after a member joined or left a held draw.
+
+    One splice in the usual case. A single chain that cannot be closed again
+    without splitting it is drawn anew for the remaining members. The same
+    arguments always give the same assignment, so repairs can be replayed.
+    """
+    rng = random.Random(seed)
+    if operation == DRAW_REPAIR_ADD:
+        members = [*assignment, user_id]
+        forbidden = build_forbidden(members, rules)
+        changes = splice_in(assignment, user_id, forbidden, rng)
+    else:
+        members = [santa_id for santa_id in assignment if santa_id != user_id]
+        forbidden = build_forbidden(members, rules)
+        try:
+            changes = splice_out(assignment, user_id, forbidden, rng, allow_swap=method != DRAW_METHOD_CYCLE)
+        except DrawInfeasibleError:
+            if method != DRAW_METHOD_CYCLE:
+                raise
+            return compute_assignment(members, rules, method, seed, history)
+
+    repaired = {santa_id: receiver_id for santa_id, receiver_id in assignment.items() if santa_id != user_id}
+    repaired.update(changes)
+    return repaired
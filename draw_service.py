@@ -0,0 +1,438 @@
+"""
+Database side of the draw: loads participants and exclusion rules for an
+event, runs the draw engine and stores DrawResult rows.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import pytz
+from sqlalchemy import select, text, update, delete, func, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from config import TIMEZONE, DB_POOL_SIZE
+from database import AsyncSessionLocal, Event, DrawResult, DrawRepair, ExclusionRule, user_group_association
+from draw import Assignment, DrawError, Feasibility, Rule, build_forbidden, check_feasibility, compute_assignment
+from draw import HISTORY_DEPTH, HistoryPair, new_draw_seed, repair_draw, DRAW_REPAIR_ADD, DRAW_REPAIR_REMOVE
+
+# Whole draw in one statement: two int arrays instead of one bind set per row
+BULK_INSERT_DRAW_RESULTS = text("""
+    INSERT INTO draw_results (event_id, santa_id, receiver_id, gift_sent, gift_delivered,
+                              gift_confirmed, notified, manual_assignment, created_at)
+    SELECT :event_id, pair.santa_id, pair.receiver_id, false, false, false, false, false, now()
+    FROM unnest(CAST(:santa_ids AS integer[]), CAST(:receiver_ids AS integer[]))
+         AS pair(santa_id, receiver_id)
+""")
+
+DRAW_UNIQUE_CONSTRAINTS = ('unique_event_santa', 'unique_event_receiver')
+
+# Recomputations when members or rules change while a draw is computed
+DRAW_INPUT_ATTEMPTS = 3
+
+logger = logging.getLogger(__name__)
+
+
+class DrawAlreadyExistsError(DrawError):
+    """Event already has stored draw results"""
+
+
+class DrawInputChangedError(DrawError):
+    """Members or exclusion rules changed while the draw was being computed"""
+
+
+@dataclass
+class DrawReplay:
+    """Stored draw compared with the one regenerated from its seed"""
+    event_id: int
+    expected: Assignment
+    stored: Assignment
+
+    @property
+    def matches(self) -> bool:
+        return self.expected == self.stored
+
+    @property
+    def mismatched_santas(self) -> List[int]:
+        return sorted(
+            santa_id for santa_id in self.expected.keys() | self.stored.keys()
+            if self.expected.get(santa_id) != self.stored.get(santa_id)
+        )
+
+
+async def get_group_member_ids(session: AsyncSession, group_id: int) -> List[int]:
+    """Get ids of all group members"""
+    result = await session.execute(
+        select(user_group_association.c.user_id).where(user_group_association.c.group_id == group_id)
+    )
+    return sorted(result.scalars().all())
+
+
+async def get_exclusion_rules(session: AsyncSession, event_id: int) -> List[Rule]:
+    """Get exclusion rules of an event as plain tuples"""
+    result = await session.execute(
+        select(ExclusionRule.user1_id, ExclusionRule.user2_id, ExclusionRule.rule_type)
+        .where(ExclusionRule.event_id == event_id)
+        .order_by(ExclusionRule.id)
+    )
+    return [tuple(row) for row in result.all()]
+
+
+async def get_draw_history(session: AsyncSession, event: Event) -> List[HistoryPair]:
+    """Get pairs drawn in the group's previous events, newest event has age 0"""
+    return (await get_draw_histories(session, [event.id]))[event.id]
+
+
+async def get_draw_histories(session: AsyncSession, event_ids: List[int]) -> Dict[int, List[HistoryPair]]:
+    """get_draw_history() for many events in one query"""
+    drawn, previous = aliased(Event), aliased(Event)
+    ranked = (
+        select(
+            drawn.id.label('event_id'),
+            previous.id.label('previous_id'),
+            (func.row_number().over(partition_by=drawn.id, order_by=previous.created_at.desc()) - 1).label('age')
+        )
+        .join(previous, and_(previous.group_id == drawn.group_id, previous.created_at < drawn.created_at))
+        .where(drawn.id.in_(event_ids))
+        .subquery()
+    )
+    result = await session.execute(
+        select(ranked.c.event_id, DrawResult.santa_id, DrawResult.receiver_id, ranked.c.age)
+        .join(ranked, DrawResult.event_id == ranked.c.previous_id)
+        .where(ranked.c.age < HISTORY_DEPTH)
+        .order_by(ranked.c.event_id, ranked.c.age, DrawResult.santa_id)
+    )
+    history: Dict[int, List[HistoryPair]] = defaultdict(list)
+    for event_id, santa_id, receiver_id, age in result.all():
+        history[event_id].append((santa_id, receiver_id, age))
+    return history
+
+
+async def load_draw_input(session: AsyncSession, event: Event) -> Tuple[List[int], List[Rule]]:
+    """Load members and exclusion rules needed to draw an event"""
+    member_ids = await get_group_member_ids(session, event.group_id)
+    rules = await get_exclusion_rules(session, event.id)
+    return member_ids, rules
+
+
+async def check_draw_feasibility(session: AsyncSession, event: Event) -> Feasibility:
+    """Check if current members and exclusion rules still admit a draw"""
+    member_ids, rules = await load_draw_input(session, event)
+    return check_feasibility(member_ids, build_forbidden(member_ids, rules))
+
+
+async def add_exclusion_rule(session: AsyncSession, event: Event, user1_id: int, user2_id: int,
+                             rule_type: str = 'mutual', reason: Optional[str] = None,
+                             strict: bool = False) -> Feasibility:
+    """Add exclusion rule and report whether the draw is still possible.
+
+    Rules are frozen once the event is drawn, so replay_draw() sees the rules
+    the draw used; raises DrawAlreadyExistsError after the draw. With
+    strict=True a rule that leaves some santas without allowed receivers is
+    rolled back instead of committed.
+    """
+    # Row lock: a concurrent save_draw_results() waits for this rule and then sees it
+    event_id = event.id
+    status = (await session.execute(
+        select(Event.status).where(Event.id == event_id).with_for_update()
+    )).scalar_one()
+    if status != 'waiting':
+        await session.rollback()
+        raise DrawAlreadyExistsError(f"event {event_id} is already drawn, its exclusion rules are frozen")
+
+    session.add(ExclusionRule(
+        event_id=event_id,
+        user1_id=user1_id,
+        user2_id=user2_id,
+        rule_type=rule_type,
+        reason=reason
+    ))
+    await session.flush()
+    report = await check_draw_feasibility(session, event)
+    if strict and report.blocking:
+        await session.rollback()
+    else:
+        await session.commit()
+    return report
+
+
+async def save_draw_results(session: AsyncSession, event_id: int, assignment: Assignment, seed: int,
+                            rules: Optional[List[Rule]] = None) -> bool:
+    """Store the whole draw and activate the event in one transaction, False if a draw already exists.
+
+    Raises DrawInputChangedError if the group's members are no longer the
+    assignment's santas, or the event's rules no longer match `rules`, the
+    exclusion rules the assignment was computed with.
+    """
+    try:
+        # Flipping the status first locks the event row against concurrent draws, rule and member changes
+        result = await session.execute(
+            update(Event)
+            .where(Event.id == event_id, Event.status == 'waiting')
+            .values(status='active', draw_seed=seed, draw_failed_at=None)
+            .returning(Event.group_id)
+        )
+        group_id = result.scalar_one_or_none()
+        if group_id is None:
+            await session.rollback()
+            return False
+        if set(await get_group_member_ids(session, group_id)) != assignment.keys():
+            await session.rollback()
+            raise DrawInputChangedError(f"members of event {event_id} changed during the draw")
+        if rules is not None and await get_exclusion_rules(session, event_id) != rules:
+            await session.rollback()
+            raise DrawInputChangedError(f"exclusion rules of event {event_id} changed during the draw")
+
+        await session.execute(BULK_INSERT_DRAW_RESULTS, {
+            'event_id': event_id,
+            'santa_ids': list(assignment.keys()),
+            'receiver_ids': list(assignment.values()),
+        })
+        await session.commit()
+    except IntegrityError as e:
+        await session.rollback()
+        if any(name in str(e.orig) for name in DRAW_UNIQUE_CONSTRAINTS):
+            return False
+        raise
+    return True
+
+
+async def run_draw(session: AsyncSession, event: Event, executor: Optional[Executor] = None) -> Assignment:
+    """Draw an event and store the results, raises DrawError if impossible.
+
+    The assignment is computed in `executor` (the loop's default one if None),
+    so a large event does not block the bot. It is recomputed if members or
+    rules change before it is saved.
+    """
+    # A failed save rolls back and expires the event, so keep its id at hand
+    event_id = event.id
+    for attempt in range(DRAW_INPUT_ATTEMPTS):
+        if attempt:
+            await session.refresh(event)
+        member_ids, rules = await load_draw_input(session, event)
+        history = await get_draw_history(session, event)
+        seed = new_draw_seed()
+        assignment = await asyncio.get_running_loop().run_in_executor(
+            executor, compute_assignment, member_ids, rules, event.draw_method, seed, history
+        )
+        try:
+            saved = await save_draw_results(session, event_id, assignment, seed, rules)
+        except DrawInputChangedError:
+            if attempt == DRAW_INPUT_ATTEMPTS - 1:
+                raise
+            continue
+        if not saved:
+            raise DrawAlreadyExistsError(f"event {event_id} already has a draw")
+        return assignment
+
+
+async def get_draw_results(session: AsyncSession, event_id: int) -> Assignment:
+    """Get stored draw of an event"""
+    result = await session.execute(
+        select(DrawResult.santa_id, DrawResult.receiver_id).where(DrawResult.event_id == event_id)
+    )
+    return dict(result.all())
+
+
+async def get_draw_repairs(session: AsyncSession, event_id: int) -> List[Tuple[str, int, int]]:
+    """Get (operation, user_id, seed) of every repair of an event's draw, oldest first"""
+    result = await session.execute(
+        select(DrawRepair.operation, DrawRepair.user_id, DrawRepair.seed)
+        .where(DrawRepair.event_id == event_id)
+        .order_by(DrawRepair.id)
+    )
+    return [tuple(row) for row in result.all()]
+
+
+async def replay_draw(session: AsyncSession, event_id: int) -> Optional[DrawReplay]:
+    """Regenerate event's draw from its stored seed and compare with stored results.
+
+    The original participants are the stored ones with logged repairs undone,
+    so members who joined the group without entering the draw do not affect
+    the replay; the repairs are then redone in order with their own seeds.
+    Exclusion rules are frozen by the draw, so the current ones are the ones
+    it used. None if the event has no seeded draw.
+    """
+    event = await session.get(Event, event_id)
+    if not event or event.draw_seed is None:
+        return None
+
+    stored = await get_draw_results(session, event_id)
+    repairs = await get_draw_repairs(session, event_id)
+    rules = await get_exclusion_rules(session, event_id)
+    history = await get_draw_history(session, event)
+
+    members = set(stored)
+    for operation, user_id, _ in reversed(repairs):
+        if operation == DRAW_REPAIR_ADD:
+            members.discard(user_id)
+        else:
+            members.add(user_id)
+
+    expected = compute_assignment(members, rules, event.draw_method, event.draw_seed, history)
+    for operation, user_id, seed in repairs:
+        expected = repair_draw(expected, operation, user_id, rules, event.draw_method, seed, history)
+    return DrawReplay(event_id=event_id, expected=expected, stored=stored)
+
+
+async def _apply_draw_changes(session: AsyncSession, event_id: int, stored: Assignment,
+                              repaired: Assignment) -> Assignment:
+    """Rewrite the links that differ between the stored and the repaired draw, returns them.
+
+    Changed rows are deleted before their replacements are inserted, so no
+    receiver is ever held by two santas.
+    """
+    changes = {santa_id: receiver_id for santa_id, receiver_id in repaired.items()
+               if stored.get(santa_id) != receiver_id}
+    dropped = [santa_id for santa_id in stored if santa_id not in repaired or santa_id in changes]
+    if dropped:
+        await session.execute(
+            delete(DrawResult).where(DrawResult.event_id == event_id, DrawResult.santa_id.in_(dropped))
+        )
+    if changes:
+        await session.execute(BULK_INSERT_DRAW_RESULTS, {
+            'event_id': event_id,
+            'santa_ids': list(changes.keys()),
+            'receiver_ids': list(changes.values()),
+        })
+    return changes
+
+
+async def _repair_held_draw(session: AsyncSession, event: Event, operation: str, user_id: int) -> Assignment:
+    """Apply one logged repair to the event's stored draw, returns changed links"""
+    stored = await get_draw_results(session, event.id)
+    if (user_id in stored) == (operation == DRAW_REPAIR_ADD):
+        return {}
+
+    rules = await get_exclusion_rules(session, event.id)
+    history = await get_draw_history(session, event)
+    seed = new_draw_seed()
+    repaired = repair_draw(stored, operation, user_id, rules, event.draw_method, seed, history)
+    changes = await _apply_draw_changes(session, event.id, stored, repaired)
+    session.add(DrawRepair(event_id=event.id, operation=operation, user_id=user_id, seed=seed))
+    return changes
+
+
+async def add_member_to_draw(session: AsyncSession, event: Event, user_id: int) -> Assignment:
+    """Splice a member who joined after the draw into it, touching two rows.
+
+    Changed rows are rewritten as not notified, so notify_draw_results() reaches
+    only the affected santas. Raises DrawInfeasibleError if exclusions leave no place.
+    """
+    return await _repair_held_draw(session, event, DRAW_REPAIR_ADD, user_id)
+
+
+async def remove_member_from_draw(session: AsyncSession, event: Event, user_id: int) -> Assignment:
+    """Take a leaving member out of the draw, reconnecting their santa with at most two changes.
+
+    A single-chain draw that cannot be closed again is drawn anew for the rest.
+    """
+    return await _repair_held_draw(session, event, DRAW_REPAIR_REMOVE, user_id)
+
+
+async def load_due_draws(session: AsyncSession,
+                         now: datetime) -> List[Tuple[Event, List[int], List[Rule], List[HistoryPair]]]:
+    """Load every waiting event whose start date has come, with members, rules and history.
+
+    Events whose scheduled draw already failed are left to their organizer.
+    """
+    result = await session.execute(
+        select(Event).where(
+            Event.status == 'waiting',
+            Event.start_date <= now,
+            Event.draw_failed_at.is_(None)
+        ).order_by(Event.start_date)
+    )
+    events = result.scalars().all()
+    if not events:
+        return []
+
+    members: Dict[int, List[int]] = defaultdict(list)
+    result = await session.execute(
+        select(user_group_association.c.group_id, user_group_association.c.user_id)
+        .where(user_group_association.c.group_id.in_({event.group_id for event in events}))
+        .order_by(user_group_association.c.user_id)
+    )
+    for group_id, user_id in result.all():
+        members[group_id].append(user_id)
+
+    rules: Dict[int, List[Rule]] = defaultdict(list)
+    result = await session.execute(
+        select(ExclusionRule.event_id, ExclusionRule.user1_id, ExclusionRule.user2_id, ExclusionRule.rule_type)
+        .where(ExclusionRule.event_id.in_([event.id for event in events]))
+        .order_by(ExclusionRule.id)
+    )
+    for event_id, user1_id, user2_id, rule_type in result.all():
+        rules[event_id].append((user1_id, user2_id, rule_type))
+
+    history = await get_draw_histories(session, [event.id for event in events])
+    return [(event, members[event.group_id], rules[event.id], history[event.id]) for event in events]
+
+
+async def _save_due_draw(event_id: int, assignment: Assignment, seed: int, rules: List[Rule],
+                         limit: asyncio.Semaphore) -> bool:
+    """Store one computed draw in its own session"""
+    async with limit:
+        async with AsyncSessionLocal() as session:
+            return await save_draw_results(session, event_id, assignment, seed, rules)
+
+
+async def mark_draws_failed(event_ids: List[int]):
+    """Stop retrying scheduled draws that failed"""
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            update(Event)
+            .where(Event.id.in_(event_ids), Event.status == 'waiting')
+            .values(draw_failed_at=datetime.now(pytz.timezone(TIMEZONE)))
+        )
+        await session.commit()
+
+
+async def run_due_draws(executor: Executor) -> Tuple[List[int], Dict[int, Exception]]:
+    """Draw all events that reached start date.
+
+    Assignments are computed in the executor (a process pool spreads them over
+    cores) and saved concurrently, one session per event. Returns ids of drawn
+    events and the error of each event whose draw could not be computed; those
+    are marked failed and not retried until drawn by hand.
+    """
+    async with AsyncSessionLocal() as session:
+        due = await load_due_draws(session, datetime.now(pytz.timezone(TIMEZONE)))
+    if not due:
+        return [], {}
+
+    loop = asyncio.get_running_loop()
+    seeds = [new_draw_seed() for _ in due]
+    assignments = await asyncio.gather(*[
+        loop.run_in_executor(executor, compute_assignment, member_ids, rules, event.draw_method, seed, history)
+        for (event, member_ids, rules, history), seed in zip(due, seeds)
+    ], return_exceptions=True)
+
+    limit = asyncio.Semaphore(max(1, DB_POOL_SIZE // 2))
+    pending = []
+    failed: Dict[int, Exception] = {}
+    for (event, _, rules, _), assignment, seed in zip(due, assignments, seeds):
+        if isinstance(assignment, Exception):
+            logger.warning(f"Scheduled draw for event {event.id} failed: {assignment!r}")
+            failed[event.id] = assignment
+            continue
+        pending.append((event.id, _save_due_draw(event.id, assignment, seed, rules, limit)))
+
+    saved = await asyncio.gather(*[save for _, save in pending], return_exceptions=True)
+    drawn = []
+    for (event_id, _), result in zip(pending, saved):
+        if isinstance(result, DrawInputChangedError):
+            logger.info(f"Draw for event {event_id} is retried on the next pass: {result}")
+        elif isinstance(result, Exception):
+            logger.error(f"Failed to save draw for event {event_id}: {result!r}")
+        elif result:
+            drawn.append(event_id)
+
+    if failed:
+        await mark_draws_failed(list(failed))
+    return drawn, failed
@@ -0,0 +1,161 @@
+"""
+FSM storage that survives restarts: keeps aiogram states in the Postgres
+fsm_storage table (UNLOGGED, see migration 0007) behind a write-behind
+in-memory layer.
+
+Handlers read and write the in-memory copy; changed keys are upserted in one
+batched statement every `flush_interval` seconds. A crash loses at most that
+window of transitions, and an unclean Postgres shutdown empties the UNLOGGED
+table, which for half-finished dialogs is an acceptable trade for cheap writes.
+"""
+import asyncio
+import contextlib
+import copy
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+LOAD_RECORD = text("SELECT state, CAST(data AS text) AS data FROM fsm_storage WHERE key = :key")
+
+UPSERT_RECORDS = text("""
+    INSERT INTO fsm_storage (key, state, data, updated_at)
+    SELECT record.key, record.state, CAST(record.data AS jsonb), now()
+    FROM unnest(CAST(:keys AS text[]), CAST(:states AS text[]), CAST(:datas AS text[]))
+         AS record(key, state, data)
+    ON CONFLICT (key) DO UPDATE
+    SET state = EXCLUDED.state, data = EXCLUDED.data, updated_at = EXCLUDED.updated_at
+""")
+
+DELETE_RECORDS = text("DELETE FROM fsm_storage WHERE key = ANY(CAST(:keys AS text[]))")
+
+# (state, data) of one storage key
+Record = Tuple[Optional[str], Dict[str, Any]]
+EMPTY_RECORD: Record = (None, {})
+
+logger = logging.getLogger(__name__)
+
+
+class PostgresStorage(BaseStorage):
+    """aiogram FSM storage in Postgres with write-behind batching.
+
+    A record that is already written is trusted for `record_ttl` seconds
+    after it was loaded or written, then read from the table again, so a key
+    another bot process changed is picked up within that window plus its
+    `flush_interval`. Changes not yet written are never reloaded.
+    """
+
+    def __init__(self, engine: AsyncEngine, flush_interval: float = 1.0, cache_size: int = 10000,
+                 record_ttl: float = 5.0, key_builder: Optional[KeyBuilder] = None):
+        self.engine = engine
+        self.flush_interval = flush_interval
+        self.cache_size = cache_size
+        self.record_ttl = record_ttl
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.records: OrderedDict = OrderedDict()
+        self.dirty = set()
+        # When each record in memory was loaded or written
+        self.stamps: Dict[str, float] = {}
+        self._flusher: Optional[asyncio.Task] = None
+
+    async def _load(self, key: str) -> Record:
+        """Record from memory, or from the table on first access and once a written record expired"""
+        record = self.records.get(key)
+        stamp = self.stamps.get(key)
+        if record is not None and (key in self.dirty or time.monotonic() - stamp < self.record_ttl):
+            self.records.move_to_end(key)
+            return record
+
+        async with self.engine.connect() as conn:
+            row = (await conn.execute(LOAD_RECORD, {'key': key})).first()
+        # Another coroutine may have written or loaded the key while we were loading
+        if key in self.records and self.stamps.get(key) != stamp:
+            return self.records[key]
+        record = (row.state, json.loads(row.data)) if row else EMPTY_RECORD
+        self.records[key] = record
+        self.records.move_to_end(key)
+        self.stamps[key] = time.monotonic()
+        self._evict()
+        return record
+
+    def _store(self, key: str, record: Record):
+        self.records[key] = record
+        self.records.move_to_end(key)
+        self.stamps[key] = time.monotonic()
+        self.dirty.add(key)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    def _evict(self):
+        """Drop least recently used records that are already written"""
+        for key in list(self.records):
+            if len(self.records) <= self.cache_size:
+                break
+            if key not in self.dirty:
+                del self.records[key]
+                del self.stamps[key]
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self.key_builder.build(key)
+        _, data = await self._load(storage_key)
+        self._store(storage_key, (state.state if isinstance(state, State) else state, data))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._load(self.key_builder.build(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        storage_key = self.key_builder.build(key)
+        state, _ = await self._load(storage_key)
+        self._store(storage_key, (state, copy.deepcopy(data)))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._load(self.key_builder.build(key))
+        return copy.deepcopy(data)
+
+    async def flush(self):
+        """Write all changed records in one transaction"""
+        if not self.dirty:
+            return
+        keys, self.dirty = self.dirty, set()
+        changed = {key: self.records.get(key, EMPTY_RECORD) for key in keys}
+        upserts = {key: record for key, record in changed.items() if record != EMPTY_RECORD}
+        deletes = [key for key, record in changed.items() if record == EMPTY_RECORD]
+
+        try:
+            async with self.engine.begin() as conn:
+                if upserts:
+                    await conn.execute(UPSERT_RECORDS, {
+                        'keys': list(upserts),
+                        'states': [state for state, _ in upserts.values()],
+                        'datas': [json.dumps(data, ensure_ascii=False) for _, data in upserts.values()],
+                    })
+                if deletes:
+                    await conn.execute(DELETE_RECORDS, {'keys': deletes})
+        except BaseException:
+            # Keep them for the next attempt, also when close() cancels a flush in flight
+            self.dirty |= keys
+            raise
+
+    async def _flush_loop(self):
+        while self.dirty:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to flush FSM storage, {len(self.dirty)} keys pending: {e!r}")
+
+    async def close(self) -> None:
+        """Stop the background flusher and write what is left"""
+        flusher, self._flusher = self._flusher, None
+        if flusher is not None:
+            flusher.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await flusher
+        await self.flush()
@@ -1,44 +1,106 @@
 #!/usr/bin/env python3
 """
 Database migration script for PostgreSQL
+
+Applies the numbered SQL files from db_migrations/ (NNNN_description.sql) in
+order and records each one in the schema_version table. An advisory lock
+makes sure only one replica migrates at a time; the others wait and then
+find nothing left to apply.
 """
+import os
+import re
 import sys
-from sqlalchemy import text
+from typing import List, Tuple
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Connection
 from sqlalchemy.exc import SQLAlchemyError
 
-from database import sync_engine, Base
+from config import SYNC_DATABASE_URL
 
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'db_migrations')
+MIGRATION_FILE = re.compile(r'^(\d{4})_(\w+)\.sql$')
 
-def init_database():
-    """Initialize database and create tables"""
-    print("🔄 Инициализация базы данных PostgreSQL...")
+# Arbitrary constant shared by all replicas
+MIGRATION_LOCK_KEY = 7_246_113_001
 
-    try:
-        # Create tables
-        Base.metadata.create_all(bind=sync_engine)
-        print("✅ Таблицы успешно созданы")
 
-        # Create PostgreSQL extensions if needed
-        with sync_engine.begin() as conn:
-            # Enable UUID extension if you plan to use it
-            # conn.execute(text("CREATE EXTENSION IF NOT EXISTS \"uuid-ossp\";"))
-            pass
+def discover_migrations() -> List[Tuple[int, str, str]]:
+    """Find migration files as (version, name, path), ordered by version"""
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = MIGRATION_FILE.match(filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    migrations.sort()
 
-        print("✅ База данных успешно инициализирована")
-        return True
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError("Duplicate migration version in db_migrations/")
+    return migrations
 
-    except SQLAlchemyError as e:
-        print(f"❌ Ошибка при инициализации БД: {e}")
-        return False
+
+def ensure_version_table(conn: Connection):
+    """Create schema_version table if missing"""
+    with conn.begin():
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_version ("
+            "version INTEGER PRIMARY KEY, "
+            "name TEXT NOT NULL, "
+            "applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now())"
+        ))
+
+
+def applied_versions(conn: Connection) -> set:
+    """Versions already recorded in schema_version"""
+    with conn.begin():
+        return set(conn.execute(text("SELECT version FROM schema_version")).scalars())
+
+
+def apply_migration(conn: Connection, version: int, name: str, path: str):
+    """Run one migration file and record it, in a single transaction"""
+    with open(path, encoding='utf-8') as f:
+        sql = f.read()
+
+    with conn.begin():
+        conn.exec_driver_sql(sql)
+        conn.execute(
+            text("INSERT INTO schema_version (version, name) VALUES (:version, :name)"),
+            {'version': version, 'name': name}
+        )
 
 
 def run_migrations():
-    """Run all migrations"""
+    """Run all pending migrations"""
     print("🚀 Запуск миграций базы данных...")
 
-    # 1. Initialize database
-    if not init_database():
+    engine = create_engine(SYNC_DATABASE_URL, echo=False)
+    try:
+        with engine.connect() as conn:
+            # Session-level lock: held across the per-migration transactions
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {'key': MIGRATION_LOCK_KEY})
+            conn.commit()
+            try:
+                ensure_version_table(conn)
+                done = applied_versions(conn)
+                pending = [m for m in discover_migrations() if m[0] not in done]
+
+                if not pending:
+                    print("✅ Схема базы данных актуальна")
+
+                for version, name, path in pending:
+                    print(f"🔄 Миграция {version:04d}_{name}...")
+                    apply_migration(conn, version, name, path)
+                    print(f"✅ Миграция {version:04d}_{name} применена")
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': MIGRATION_LOCK_KEY})
+                conn.commit()
+
+    except (SQLAlchemyError, OSError, ValueError) as e:
+        print(f"❌ Ошибка при миграции БД: {e}")
         return False
+    finally:
+        engine.dispose()
 
     print("🎉 Все миграции успешно выполнены!")
     return True
@@ -46,4 +108,4 @@ def run_migrations():
 
 if __name__ == "__main__":
     success = run_migrations()
-    sys.exit(0 if success else 1)
\ No newline at end of file
+    sys.exit(0 if success else 1)
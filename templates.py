@@ -0,0 +1,223 @@
+"""
+Message and keyboard templates, compiled once at import.
+
+Message skeletons are parsed into literal parts and named fields up front;
+rendering only escapes and joins the dynamic values. Keyboards without
+placeholders are built into a single InlineKeyboardMarkup that every update
+reuses.
+
+Formatted messages go out with parse_mode="HTML" and every field is passed
+through html.escape, so a group called "<my_group>" or a name with "*" or "&"
+is shown as typed, also inside <b> and <code>. Legacy Markdown cannot do
+that: it has no escapes inside an entity.
+"""
+import html
+from string import Formatter
+from typing import List, Optional, Sequence, Tuple
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+PARSE_MODE = "HTML"
+# Telegram rejects longer messages
+MAX_MESSAGE_LENGTH = 4096
+
+
+def escape_html(value) -> str:
+    """Escape HTML control characters in user content"""
+    return html.escape(str(value), quote=False)
+
+
+def shorten(value, limit: int) -> str:
+    """Cut user content to `limit` characters, marking the cut with an ellipsis"""
+    value = str(value)
+    return value if len(value) <= limit else value[:limit - 1] + '…'
+
+
+class Raw(str):
+    """Field value that is already HTML and is inserted as is"""
+
+
+class MessageTemplate:
+    """Message skeleton with {field} placeholders, HTML-escaped unless escape=False"""
+
+    def __init__(self, template: str, escape: bool = True):
+        self.escape = escape
+        self.parts: List[Tuple[str, Optional[str], str]] = [
+            (literal, field, spec) for literal, field, spec, _ in Formatter().parse(template)
+        ]
+
+    def render(self, **fields) -> str:
+        out = []
+        for literal, field, spec in self.parts:
+            out.append(literal)
+            if field is None:
+                continue
+            value = fields[field]
+            if isinstance(value, Raw):
+                out.append(value)
+            elif self.escape:
+                out.append(escape_html(format(value, spec)))
+            else:
+                out.append(format(value, spec))
+        return ''.join(out)
+
+
+class KeyboardTemplate:
+    """Inline keyboard laid out `width` buttons per row; callback data may hold {placeholders}"""
+
+    def __init__(self, buttons: Sequence[Tuple[str, str]], width: int = 2):
+        self.rows = [tuple(buttons[i:i + width]) for i in range(0, len(buttons), width)]
+        static = all('{' not in callback_data for _, callback_data in buttons)
+        self.markup = self._build() if static else None
+
+    def _build(self, **fields) -> InlineKeyboardMarkup:
+        return InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text=text, callback_data=callback_data.format(**fields))
+             for text, callback_data in row]
+            for row in self.rows
+        ])
+
+    def render(self, **fields) -> InlineKeyboardMarkup:
+        return self.markup if self.markup is not None else self._build(**fields)
+
+
+# ==================== MAIN MENU ====================
+
+WELCOME_BACK = MessageTemplate(
+    "🎅 Добро пожаловать, {full_name}!\n\n"
+    "Выберите действие:",
+    escape=False
+)
+
+MAIN_MENU_BUTTONS = [
+    ("📋 Мой профиль", "profile"),
+    ("👥 Мои группы", "my_groups"),
+    ("🎮 Активная игра", "active_game"),
+]
+MAIN_MENU_KEYBOARD = KeyboardTemplate(MAIN_MENU_BUTTONS)
+ADMIN_MAIN_MENU_KEYBOARD = KeyboardTemplate(MAIN_MENU_BUTTONS + [("👑 Админ-панель", "admin_panel")])
+
+# ==================== PROFILE ====================
+
+PROFILE = MessageTemplate(
+    "👤 <b>Ваш профиль</b>\n\n"
+    "• Имя: {full_name}\n"
+    "• Пожелания: {wishlist}...\n"
+    "• Групп: {group_count}\n"
+    "• Дата регистрации: {registered_at:%d.%m.%Y}\n"
+)
+PROFILE_ADMIN = "• 👑 Статус: Администратор\n"
+PROFILE_KEYBOARD = KeyboardTemplate([
+    ("✏️ Изменить ФИО", "edit_name"),
+    ("🎁 Изменить пожелания", "edit_wishlist"),
+    ("📱 Добавить контакты", "add_contacts"),
+])
+
+# ==================== GROUPS ====================
+
+GROUP_CREATED = MessageTemplate(
+    "✅ Группа <b>{name}</b> создана!\n\n"
+    "📋 <b>Информация:</b>\n"
+    "• Код приглашения: <code>{invite_code}</code>\n"
+    "• Участников: 1\n"
+    "• Статус: Открыта для регистрации\n\n"
+    "📢 <b>Пригласите друзей:</b>\n"
+    "Отправьте им код: <code>{invite_code}</code>\n"
+    "Или используйте команду:\n"
+    "<code>/join {invite_code}</code>"
+)
+
+GROUP_JOINED = MessageTemplate(
+    "✅ Вы присоединились к группе <b>{name}</b>!\n\n"
+    "📋 <b>Информация:</b>\n"
+    "• Участников: {member_count}\n"
+    "• Организатор: {creator_name}\n"
+    "• Описание: {description}\n\n"
+    "Используйте /my_groups для просмотра ваших групп."
+)
+
+GROUP_LEFT = MessageTemplate("🚪 Вы покинули группу <b>{name}</b>")
+
+NO_GROUPS = (
+    "📋 <b>У вас пока нет групп</b>\n\n"
+    "Создайте свою группу или присоединитесь к существующей:\n"
+    "• /create_group - создать новую группу\n"
+    "• /join КОД - присоединиться по коду"
+)
+
+MY_GROUPS_HEADER = "📋 <b>Ваши группы:</b>\n\n"
+MY_GROUP_ENTRY = MessageTemplate(
+    "🎮 <b>{name}</b>\n"
+    "   👥 Участников: {member_count}\n"
+    "   🔑 Код: <code>{invite_code}</code>\n"
+)
+MY_GROUP_STATUS = MessageTemplate("   {emoji} Статус: {status}\n")
+
+GROUP_DETAIL = MessageTemplate(
+    "🎮 <b>Группа: {name}</b>\n\n"
+    "📝 Описание: {description}\n"
+    "👥 Участников: {member_count}\n"
+    "🔑 Код приглашения: <code>{invite_code}</code>\n"
+    "👑 Создатель: {creator_name}\n\n"
+)
+GROUP_EVENT = MessageTemplate(
+    "🎅 <b>Активное событие:</b> {name}\n"
+    "📅 Статус: {status}\n"
+    "🎲 Жеребьевка: {draw_method}\n"
+)
+EVENT_START = MessageTemplate("⏰ Начало: {date:%d.%m.%Y %H:%M}\n")
+EVENT_END = MessageTemplate("🏁 Окончание: {date:%d.%m.%Y %H:%M}\n")
+
+GROUP_ORGANIZER_KEYBOARD = KeyboardTemplate([
+    ("⚙️ Управление группой", "manage_group_{group_id}"),
+    ("👥 Участники", "group_members_{group_id}"),
+    ("🎲 Запустить жеребьевку", "start_draw_{group_id}"),
+    ("📅 Установить даты", "set_dates_{group_id}"),
+    ("🔁 Режим жеребьевки", "draw_method_{group_id}"),
+    ("🚫 Исключения", "exclude_{group_id}"),
+    ("◀️ Назад к группам", "back_to_groups"),
+])
+GROUP_MEMBER_KEYBOARD = KeyboardTemplate([
+    ("👥 Участники", "group_members_{group_id}"),
+    ("📊 Статистика", "group_stats_{group_id}"),
+    ("🚪 Покинуть группу", "leave_group_{group_id}"),
+    ("◀️ Назад к группам", "back_to_groups"),
+])
+
+# ==================== DRAW ====================
+
+DRAW_HELD = MessageTemplate(
+    "🎲 Жеребьевка в группе <b>{name}</b> проведена!\n\n"
+    "👥 Участников: {count}\n"
+    "Каждый участник получит имя своего получателя в личные сообщения."
+)
+DRAW_RESULT = MessageTemplate(
+    "🎅 <b>Жеребьевка проведена!</b>\n\n"
+    "Вы - Тайный Санта для: <b>{full_name}</b>\n\n"
+    "🎁 Пожелания: {wishlist}\n"
+)
+DRAW_RESULT_CONTACTS = MessageTemplate("📱 Контакты: {contact_info}\n")
+
+# ==================== ADMIN ====================
+
+ADMIN_PANEL = (
+    "👑 <b>Панель администратора</b>\n\n"
+    "Выберите действие:"
+)
+ADMIN_PANEL_KEYBOARD = KeyboardTemplate([
+    ("📅 Установить даты", "admin_set_dates"),
+    ("👥 Участники", "admin_view_users"),
+    ("🎲 Запустить жеребьевку", "admin_start_draw"),
+    ("📊 Статистика", "admin_stats"),
+    ("📢 Рассылка", "admin_broadcast"),
+    ("🔍 Найти пару", "admin_find_pair"),
+    ("📦 Группы", "admin_groups"),
+])
+
+ADMIN_GROUPS_HEADER = "📦 <b>Все группы:</b>\n\n"
+ADMIN_GROUP_ENTRY = MessageTemplate(
+    "🎮 <b>{name}</b>\n"
+    "   👥 Участников: {member_count}\n"
+    "   🔑 Код: <code>{invite_code}</code>\n"
+    "   👑 Создатель: {creator_name}\n\n"
+)